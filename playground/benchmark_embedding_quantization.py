@@ -0,0 +1,78 @@
+"""
+Benchmark float32 / float16 / int8 embedding storage: memory, scoring speed and recall@k against float32.
+
+Fixture corpus
+- synthetic: clustered unit vectors with the dimension of text-embedding-ada-002 (default)
+- web_cache: sentences of the answers cached in .cache/web, embedded offline by HashingSemanticSearchService,
+  queried by the cached search texts
+
+Usage (from src/): python ../playground/benchmark_embedding_quantization.py --fixture synthetic --size 20000 --k 10
+"""
+import argparse
+import glob
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from EmbeddingQuantizer import QuantizedEmbeddingMatrix, SUPPORTED_EMBEDDING_DTYPE, encode_vector
+from SemanticSearchService import get_top_n_index, normalize_embedding_matrix
+from Util import get_project_root
+
+
+def load_synthetic_fixture(size, dim, number_of_query, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, size // 100), dim)).astype(np.float32)
+    corpus = centers[rng.integers(0, len(centers), size)] + 0.5 * rng.standard_normal((size, dim)).astype(np.float32)
+    corpus = normalize_embedding_matrix(corpus)
+    queries = corpus[rng.choice(size, number_of_query, replace=False)] + 0.3 * rng.standard_normal((number_of_query, dim)).astype(np.float32)
+    return corpus, normalize_embedding_matrix(queries)
+
+
+def load_web_cache_fixture():
+    import yaml
+    from SemanticSearchService import HashingSemanticSearchService
+
+    with open(os.path.join(get_project_root(), 'src/config/config.yaml'), encoding='utf-8') as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    sentence_list, query_list = [], []
+    for file_path in glob.glob(os.path.join(get_project_root(), '.cache', 'web', '*.pickle')):
+        with open(file_path, 'rb') as f:
+            _, source_text, _ = pickle.load(f)['result']
+        sentence_list += [line.strip() for line in source_text.split('\n') if line.startswith('  ') and line.strip()]
+        query_list.append(os.path.basename(file_path)[:-len('.pickle')])
+    service = HashingSemanticSearchService(config)
+    return service.get_embedding_matrix(sentence_list), service.get_embedding_matrix(query_list)
+
+
+def benchmark(corpus, queries, k):
+    exact_top_k = [set(get_top_n_index(corpus @ query, k)) for query in queries]
+    print(f"corpus: {corpus.shape}, queries: {len(queries)}, k: {k}")
+    print(f"{'dtype':<8} {'memory MB':>10} {'bytes/vector on disk':>21} {'ms/query':>9} {f'recall@{k}':>10}")
+    for dtype in SUPPORTED_EMBEDDING_DTYPE:
+        matrix = QuantizedEmbeddingMatrix.from_float32(corpus, dtype)
+        start_time = time.perf_counter()
+        top_k_list = [set(get_top_n_index(matrix.dot(query), k)) for query in queries]
+        ms_per_query = (time.perf_counter() - start_time) * 1000 / len(queries)
+        recall = np.mean([len(top_k & exact) / len(exact) for top_k, exact in zip(top_k_list, exact_top_k)])
+        print(f"{dtype:<8} {matrix.nbytes / 2 ** 20:>10.1f} {len(encode_vector(corpus[0], dtype)):>21} {ms_per_query:>9.3f} {recall:>10.4f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixture', default='synthetic', choices=['synthetic', 'web_cache'])
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--query', type=int, default=100)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.fixture == 'synthetic':
+        corpus, queries = load_synthetic_fixture(args.size, args.dim, args.query)
+    else:
+        corpus, queries = load_web_cache_fixture()
+    benchmark(corpus, queries, args.k)
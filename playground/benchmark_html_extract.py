@@ -0,0 +1,139 @@
+"""
+Benchmark the html extractors of text_extract/html: pages/sec, peak memory and sentence yield.
+
+Fixture pages
+- html_dir: saved pages, every *.html file of a directory (default: playground/fixture/html, a Wikipedia article,
+  a WordPress blog post and a news article). The main content paragraphs of page.html are listed in page.txt, one per line,
+  thus precision and recall of the main content are reported as well
+- url_content: pages kept by the per-url cache (.cache/url_content), i.e. real Bing result pages fetched by this app
+- synthetic: generated pages with navigation / sidebar / comments / footer around an article,
+  the article sentences are known as well. Useful for volume, but its markup is simpler than real pages
+
+Each extractor runs in its own process. max RSS includes the import of the extractor library,
+peak growth is the growth of max RSS during extraction (C parsers included).
+A usable sentence has at least 8 words, the same filter as BingService.
+
+Usage (from src/): python ../playground/benchmark_html_extract.py --fixture html_dir --repeat 50
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import random
+import re
+import resource
+import sqlite3
+import sys
+import time
+import zlib
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from HtmlExtractPool import decode_html
+from Util import get_project_root
+from text_extract.html import support_html_extract_svc, html_extract_svc_class_map
+
+WORD_LIST = ('search engine model language answer source query result index vector page text token prompt cache '
+             'network latency memory parser sentence paragraph article content quality ranking').split()
+
+
+def get_usable_sentences(paragraph_list) -> list:
+    return [text for text in paragraph_list if len(re.findall(r'\w+', text)) >= 8]
+
+
+def split_sentences(text) -> list:
+    """
+    Input: 'First  sentence. Second one!'
+    Output: ['First sentence.', 'Second one!']
+    """
+    return [sentence for sentence in re.split(r'(?<=[.!?])\s+', ' '.join(text.split())) if sentence]
+
+
+def make_sentence(rng, prefix):
+    return f"{prefix} " + ' '.join(rng.choice(WORD_LIST) for _ in range(rng.randint(10, 25))) + '.'
+
+
+def make_synthetic_page(rng, page_id):
+    """:return: (html, article sentence list)"""
+    article_list = [make_sentence(rng, f'Article {page_id}-{i}') for i in range(rng.randint(5, 30))]
+    boilerplate = lambda name: make_sentence(rng, f'Boilerplate {name}')
+    links = lambda n: ''.join(f'<li><a href="/{i}">{boilerplate("link")}</a></li>' for i in range(n))
+    html = ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Page</title>'
+            f'<style>body {{margin: 0}}</style><script>var tracking = "{boilerplate("script")}";</script></head><body>'
+            f'<header><nav><ul>{links(8)}</ul></nav></header>'
+            f'<div class="cookie-banner"><p>{boilerplate("cookie")}</p></div>'
+            f'<div id="main"><article><h1>Title of page {page_id}</h1>'
+            + ''.join(f'<p>{sentence} <a href="/x">see more</a></p>' if i % 3 == 0 else f'<p>{sentence}</p>' for i, sentence in enumerate(article_list))
+            + f'</article><div class="related-posts"><ul>{links(5)}</ul></div>'
+            f'<section class="comments"><p>{boilerplate("comment")}</p><p>{boilerplate("comment")}</p></section></div>'
+            f'<aside><p>{boilerplate("sidebar")}</p></aside>'
+            f'<footer><p>{boilerplate("footer")}</p></footer></body></html>')
+    return html, article_list
+
+
+def load_fixture(fixture, size, html_dir):
+    """:return: list of (html bytes, article sentence list or None)"""
+    if fixture == 'synthetic':
+        rng = random.Random(0)
+        page_list = [make_synthetic_page(rng, page_id) for page_id in range(size)]
+        return [(html.encode('utf-8'), article_list) for html, article_list in page_list]
+    if fixture == 'html_dir':
+        page_list = []
+        for path in sorted(glob.glob(os.path.join(html_dir, '*.html')))[:size]:
+            expected_path = path[:-len('.html')] + '.txt'
+            expected_list = open(expected_path, encoding='utf-8').read().splitlines() if os.path.exists(expected_path) else None
+            page_list.append((open(path, 'rb').read(), expected_list))
+        return page_list
+    db_path = os.path.join(get_project_root(), '.cache', 'url_content', 'url_content.sqlite3')
+    rows = sqlite3.connect(db_path).execute('SELECT html FROM page WHERE html IS NOT NULL LIMIT ?', (size,)).fetchall()
+    return [(zlib.decompress(html), None) for html, in rows]
+
+
+def run_extractor(extract_svc_name, page_list, repeat):
+    html_list = [decode_html(content) for content, _ in page_list]
+    extract_svc = html_extract_svc_class_map[extract_svc_name]()
+    max_rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        result_list = [extract_svc.extract_from_html(html) for html in html_list]
+    elapsed = time.perf_counter() - start_time
+    max_rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on linux
+
+    usable_list = [get_usable_sentences(paragraph_list) for paragraph_list in result_list]
+    stats = {'pages/sec': len(html_list) * repeat / elapsed,
+             'max RSS MB': max_rss_after / 1024,
+             'peak growth MB': (max_rss_after - max_rss_before) / 1024,
+             'sentences/page': sum(len(usable) for usable in usable_list) / len(html_list)}
+    if all(article_list is not None for _, article_list in page_list):
+        # sentence level precision / recall of the main content (substring match, whitespace normalized)
+        number_of_article, number_of_found, number_of_extracted, number_of_correct = 0, 0, 0, 0
+        for (_, article_list), usable in zip(page_list, usable_list):
+            article_sentence_list = [sentence for paragraph in article_list for sentence in split_sentences(paragraph)]
+            extracted_sentence_list = [sentence for paragraph in usable for sentence in split_sentences(paragraph)]
+            article_text, extracted_text = '\n'.join(article_sentence_list), '\n'.join(extracted_sentence_list)
+            number_of_article += len(article_sentence_list)
+            number_of_found += sum(1 for sentence in article_sentence_list if sentence in extracted_text)
+            number_of_extracted += len(extracted_sentence_list)
+            number_of_correct += sum(1 for sentence in extracted_sentence_list if sentence in article_text)
+        stats['precision'] = number_of_correct / max(1, number_of_extracted)
+        stats['recall'] = number_of_found / max(1, number_of_article)
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixture', default='html_dir', choices=['html_dir', 'synthetic', 'url_content'])
+    parser.add_argument('--html_dir', default=os.path.join(os.path.dirname(__file__), 'fixture', 'html'))
+    parser.add_argument('--size', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--extractor', nargs='+', default=support_html_extract_svc, choices=support_html_extract_svc)
+    args = parser.parse_args()
+
+    page_list = load_fixture(args.fixture, args.size, args.html_dir)
+    print(f"fixture: {args.fixture}, pages: {len(page_list)}, MB: {sum(len(content) for content, _ in page_list) / 2 ** 20:.1f}")
+    columns = ['pages/sec', 'max RSS MB', 'peak growth MB', 'sentences/page', 'precision', 'recall']
+    print(f"{'extractor':<14}" + ''.join(f'{column:>16}' for column in columns))
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        for extract_svc_name in args.extractor:
+            stats = pool.apply(run_extractor, (extract_svc_name, page_list, args.repeat))
+            print(f"{extract_svc_name:<14}" + ''.join(f'{stats[column]:>16.3f}' if column in stats else f"{'-':>16}" for column in columns))
@@ -0,0 +1,146 @@
+import re
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from Util import setup_logger
+
+logger = setup_logger('AnswerCache')
+
+SIMILARITY_HISTOGRAM_BINS = [0.0, 0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 0.99, 1.0 + 1e-6]
+
+
+def normalize_search_text(search_text: str) -> str:
+    """
+    Input: 'What is ChatGPT?'
+    Output: 'what is chatgpt'
+    """
+    return ' '.join(re.findall(r'\w+', search_text.lower()))
+
+
+class AnswerCachePartition:
+    """Answers of one partition (same embedding model, language, LLM, sources), query embeddings as rows of one matrix"""
+
+    def __init__(self, dim: int):
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.entry_list = []  # row i of matrix: dict(search_text, normalized_search_text, answer, created_at, last_access)
+
+    def remove(self, index_list):
+        keep = np.ones(len(self.entry_list), dtype=bool)
+        keep[index_list] = False
+        self.matrix = self.matrix[keep]
+        self.entry_list = [entry for entry, is_kept in zip(self.entry_list, keep) if is_kept]
+
+
+class AnswerCache:
+    """
+    Semantic answer cache in memory: an earlier answer is reused if its query embedding is similar enough
+    - partition_key: answers are only shared between searches of the same embedding model, language, LLM and sources
+    - lookup: one matrix-vector product over the partition (query embeddings are L2-normalized, dot = cosine similarity),
+              the same search text up to case / punctuation is always a hit (similarity 1)
+    - expiry: answers older than ttl are never served, least recently used answers are evicted beyond max_number_of_answer
+    - stats: hit rate and the best similarity of recent lookups, to tune similarity_threshold
+    """
+
+    def __init__(self, similarity_threshold: float, ttl: int, max_number_of_answer: int, number_of_recent_lookup: int = 1000):
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_number_of_answer = max_number_of_answer
+        self.partition_dict = {}
+        self.hit_count = 0
+        self.miss_count = 0
+        self.recent_lookup_list = deque(maxlen=number_of_recent_lookup)  # (search_text, best matched search_text, best similarity, is_hit)
+        self.lock = threading.Lock()
+
+    def get(self, partition_key: tuple, search_text: str, embedding: np.ndarray):
+        """
+        :return: (answer or None, best similarity or None, matched search_text or None)
+        """
+        with self.lock:
+            partition = self.partition_dict.get(partition_key)
+            best_similarity, matched_search_text, answer = None, None, None
+            if partition is not None and len(partition.entry_list) > 0:
+                similarities = partition.matrix @ embedding
+                normalized_search_text = normalize_search_text(search_text)
+                similarities[[entry['normalized_search_text'] == normalized_search_text for entry in partition.entry_list]] = 1.0
+                now = time.time()
+                is_expired = np.array([now - entry['created_at'] > self.ttl for entry in partition.entry_list])
+                similarities[is_expired] = -np.inf
+                best_index = int(np.argmax(similarities))
+                if similarities[best_index] > -np.inf:
+                    best_similarity = float(similarities[best_index])
+                    matched_search_text = partition.entry_list[best_index]['search_text']
+                    if best_similarity >= self.similarity_threshold:
+                        partition.entry_list[best_index]['last_access'] = now
+                        answer = partition.entry_list[best_index]['answer']
+
+            if answer is not None:
+                self.hit_count += 1
+            else:
+                self.miss_count += 1
+            self.recent_lookup_list.append((search_text, matched_search_text, best_similarity, answer is not None))
+        logger.info(f"AnswerCache.get. search_text: {search_text}, matched: {matched_search_text}, similarity: {best_similarity}, hit: {answer is not None}")
+        return answer, best_similarity, matched_search_text
+
+    def put(self, partition_key: tuple, search_text: str, embedding: np.ndarray, answer):
+        now = time.time()
+        with self.lock:
+            partition = self.partition_dict.setdefault(partition_key, AnswerCachePartition(len(embedding)))
+            # a new answer of the same search text replaces the old one(같은 검색어의 이전 답변은 교체)
+            normalized_search_text = normalize_search_text(search_text)
+            partition.remove([i for i, entry in enumerate(partition.entry_list) if entry['normalized_search_text'] == normalized_search_text])
+            partition.matrix = np.vstack([partition.matrix, embedding.astype(np.float32)[None, :]])
+            partition.entry_list.append({'search_text': search_text, 'normalized_search_text': normalized_search_text, 'answer': answer,
+                                         'created_at': now, 'last_access': now})
+            self.evict(now)
+
+    def evict(self, now: float):
+        # expired answers first, then least recently used answers beyond max_number_of_answer
+        for partition in self.partition_dict.values():
+            partition.remove([i for i, entry in enumerate(partition.entry_list) if now - entry['created_at'] > self.ttl])
+        number_to_evict = sum(len(partition.entry_list) for partition in self.partition_dict.values()) - self.max_number_of_answer
+        if number_to_evict > 0:
+            access_list = sorted((entry['last_access'], partition_key, i) for partition_key, partition in self.partition_dict.items()
+                                 for i, entry in enumerate(partition.entry_list))
+            evict_index_dict = {}
+            for _, partition_key, i in access_list[:number_to_evict]:
+                evict_index_dict.setdefault(partition_key, []).append(i)
+            for partition_key, index_list in evict_index_dict.items():
+                self.partition_dict[partition_key].remove(index_list)
+        self.partition_dict = {partition_key: partition for partition_key, partition in self.partition_dict.items() if len(partition.entry_list) > 0}
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            recent_lookup_list = list(self.recent_lookup_list)
+            number_of_answer = sum(len(partition.entry_list) for partition in self.partition_dict.values())
+        total_count = self.hit_count + self.miss_count
+        best_similarity_list = [similarity for _, _, similarity, _ in recent_lookup_list if similarity is not None]
+        histogram, _ = np.histogram(best_similarity_list, bins=SIMILARITY_HISTOGRAM_BINS)
+        return {'hit_count': self.hit_count,
+                'miss_count': self.miss_count,
+                'hit_rate': self.hit_count / total_count if total_count > 0 else 0.0,
+                'similarity_threshold': self.similarity_threshold,
+                'number_of_answer': number_of_answer,
+                'max_number_of_answer': self.max_number_of_answer,
+                # best similarity of recent lookups, [lower bound, upper bound) -> count
+                'best_similarity_histogram': {f"[{low:.2f}, {min(high, 1.0):.2f})": int(count)
+                                              for low, high, count in zip(SIMILARITY_HISTOGRAM_BINS[:-1], SIMILARITY_HISTOGRAM_BINS[1:], histogram)},
+                'recent_lookups': [{'search_text': search_text, 'matched_search_text': matched_search_text, 'similarity': similarity, 'is_hit': is_hit}
+                                   for search_text, matched_search_text, similarity, is_hit in recent_lookup_list[-20:]]}
+
+
+# one cache per process, shared by all requests(프로세스 당 하나의 캐시 인스턴스를 공유)
+answer_cache = None
+answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache(config) -> AnswerCache:
+    global answer_cache
+    cache_config = config.get('cache')
+    with answer_cache_lock:
+        if answer_cache is None:
+            answer_cache = AnswerCache(cache_config.get('answer_similarity_threshold'), cache_config.get('answer_ttl'),
+                                       cache_config.get('max_number_of_answer'))
+        return answer_cache
@@ -0,0 +1,150 @@
+import asyncio
+import atexit
+import concurrent.futures
+import threading
+from collections import namedtuple
+
+import aiohttp
+
+from Util import setup_logger
+
+logger = setup_logger('AsyncPageFetcher')
+
+# same attributes as requests.Response used by BingService, content is the raw html bytes
+PageResponse = namedtuple('PageResponse', ['status_code', 'content', 'encoding', 'headers'])
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def is_allowed_content_type(content_type: str, allowed_content_types: list) -> bool:
+    """
+    Decide from the Content-Type header, before downloading the body. Missing header is allowed (e.g. 304 Not Modified).
+    Input: 'application/pdf', ['text/html', 'application/xhtml+xml']
+    Output: False
+    """
+    if not content_type:
+        return True
+    return content_type.split(';')[0].strip().lower() in allowed_content_types
+
+
+class AsyncPageFetcher:
+    """
+    Fetch web pages with asyncio on a background event loop thread
+    - one long-lived ClientSession, thus keep-alive connections and the DNS cache are reused across requests
+    - at most limit connections in total and limit_per_host connections per host
+    - fetch_many returns when all pages are done or the stage deadline is reached, unfinished pages are None
+    - non-html content types are skipped before the body is downloaded, at most max_page_byte bytes of a body are kept
+    """
+
+    def __init__(self, timeout_per_url: float, limit: int, limit_per_host: int, dns_cache_ttl: int,
+                 max_page_byte: int, allowed_content_types: list):
+        self.timeout_per_url = timeout_per_url
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.max_page_byte = max_page_byte
+        self.allowed_content_types = allowed_content_types
+        self.session = None
+        self.inflight_task_dict = {}  # (url, headers) -> task, touched only inside the event loop
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='AsyncPageFetcher', daemon=True)
+        self.thread.start()
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # session must be created inside the event loop(세션은 이벤트 루프 안에서 생성)
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             use_dns_cache=True, ttl_dns_cache=self.dns_cache_ttl)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout_per_url))
+        return self.session
+
+    async def fetch_one(self, url: str, headers: dict = None):
+        try:
+            async with self.get_session().get(url, headers=headers) as response:
+                content_type = response.headers.get('Content-Type', '')
+                if not is_allowed_content_type(content_type, self.allowed_content_types):
+                    logger.info(f"Skip url of content type {content_type}: {url}")
+                    return None
+                chunk_list, size = [], 0
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    chunk_list.append(chunk)
+                    size += len(chunk)
+                    if size >= self.max_page_byte:
+                        logger.info(f"Truncate url at {self.max_page_byte} bytes: {url}")
+                        break
+                return PageResponse(response.status, b''.join(chunk_list)[:self.max_page_byte], response.charset, response.headers)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.error(f"Failed to fetch url: {url}, {type(ex).__name__}: {ex}")
+            return None
+
+    async def fetch_one_shared(self, url: str, headers: dict = None):
+        # the same url requested by concurrent searches is downloaded once(동시에 요청된 같은 URL은 한 번만 다운로드)
+        key = (url, tuple(sorted((headers or {}).items())))
+        task = self.inflight_task_dict.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.fetch_one(url, headers))
+            self.inflight_task_dict[key] = task
+            task.add_done_callback(lambda _: self.inflight_task_dict.pop(key, None))
+        return await asyncio.shield(task)
+
+    def close(self):
+        if self.session is not None and not self.session.closed:
+            asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def submit_many(self, urls: list, headers_list: list = None) -> list:
+        """
+        Start fetching urls, callable from any (non event loop) thread. Cancel the futures of the urls no longer needed.
+        Output: [concurrent.futures.Future of PageResponse or None (failed)] in the order of urls
+        """
+        headers_list = headers_list if headers_list is not None else [None] * len(urls)
+        return [asyncio.run_coroutine_threadsafe(self.fetch_one_shared(url, headers), self.loop) for url, headers in zip(urls, headers_list)]
+
+    def iter_many(self, urls: list, deadline: float, headers_list: list = None):
+        """
+        Fetch urls and yield (index, PageResponse or None) in the order they finish, callable from any (non event loop) thread
+        headers_list: optional request headers per url. Urls not finished by the stage deadline are cancelled and not yielded.
+        Input: urls=['https://a.com', 'https://b.com'], deadline=6
+        Output: (1, PageResponse(status_code=200, content=b'<html>...</html>', encoding='utf-8', headers=...)), (0, None)  # None: failed
+        """
+        futures = self.submit_many(urls, headers_list)
+        index_dict = {future: i for i, future in enumerate(futures)}
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout=deadline):
+                yield index_dict[future], future.result()
+        except concurrent.futures.TimeoutError:
+            number_of_unfinished = sum(1 for future in futures if not future.done())
+            logger.warning(f"AsyncPageFetcher.iter_many. deadline {deadline}s reached, unfinished urls: {number_of_unfinished}/{len(futures)}")
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def fetch_many(self, urls: list, deadline: float, headers_list: list = None) -> list:
+        """
+        Same as iter_many but wait for the whole stage, result is in the order of urls
+        Output: [PageResponse(status_code=200, content=b'<html>...</html>', encoding='utf-8', headers=...), None]  # None: failed or not finished before the deadline
+        """
+        results = [None] * len(urls)
+        for i, response in self.iter_many(urls, deadline, headers_list):
+            results[i] = response
+        return results
+
+
+# one fetcher (event loop + connection pool) per process, shared by all requests(프로세스 당 하나의 fetcher를 공유)
+async_page_fetcher = None
+async_page_fetcher_lock = threading.Lock()
+
+
+def get_async_page_fetcher(config) -> AsyncPageFetcher:
+    global async_page_fetcher
+    bing_search_config = config.get('source_service').get('bing_search')
+    fetcher_config = bing_search_config.get('async_fetcher')
+    with async_page_fetcher_lock:
+        if async_page_fetcher is None:
+            async_page_fetcher = AsyncPageFetcher(fetcher_config.get('timeout_per_url'), fetcher_config.get('limit'),
+                                                  fetcher_config.get('limit_per_host'), fetcher_config.get('dns_cache_ttl'),
+                                                  bing_search_config.get('max_page_byte'), bing_search_config.get('allowed_content_types'))
+            atexit.register(async_page_fetcher.close)
+        return async_page_fetcher
@@ -1,13 +1,17 @@
 import os
 import re
 import concurrent.futures
+import time
 import pandas as pd
 import requests
 import yaml
 
-from Util import setup_logger, get_project_root, storage_cached
-from text_extract.html.beautiful_soup import BeautifulSoupSvc
-from text_extract.html.trafilatura import TrafilaturaSvc
+from AsyncPageFetcher import PageResponse, DOWNLOAD_CHUNK_SIZE, get_async_page_fetcher, is_allowed_content_type
+from HtmlExtractPool import get_html_extract_pool, extract_from_html_bytes
+from UrlContentCache import UrlContentCache, get_url_content_cache
+from TextDfUtil import build_text_df, MIN_WORD_COUNT
+from Util import setup_logger, get_project_root, storage_cached, single_flight
+from text_extract.html import html_extract_svc_class_map
 
 logger = setup_logger('BingService')
 
@@ -17,11 +21,15 @@ class BingService:
         self.config = config
         # 설정 파일에서 텍스트 추출 서비스 선택
         extract_svc = self.config.get('source_service').get('bing_search').get('text_extract')
-        if extract_svc == 'trafilatura':
-            self.txt_extract_svc = TrafilaturaSvc()
-        elif extract_svc == 'beautifulsoup':
-            self.txt_extract_svc = BeautifulSoupSvc()
+        self.txt_extract_svc = html_extract_svc_class_map[extract_svc]()
+        self.extract_svc_name = extract_svc
+        # 추출 전용 프로세스 풀 (0이면 요청 스레드에서 추출)
+        extract_process_count = self.config.get('source_service').get('bing_search').get('extract_process_count')
+        extract_timeout = self.config.get('source_service').get('bing_search').get('extract_timeout')
+        self.html_extract_pool = get_html_extract_pool(extract_svc, extract_process_count, extract_timeout) if extract_process_count > 0 else None
+        self.url_content_cache = get_url_content_cache(config) if config.get('cache').get('is_enable').get('url_content') else None
 
+    @single_flight('bing_search_website', 'search_text')
     @storage_cached('bing_search_website', 'search_text')
     def call_bing_search_api(self, search_text: str) -> pd.DataFrame:
         logger.info("BingService.call_bing_search_api. query: " + search_text)
@@ -41,7 +49,7 @@ class BingService:
             if response.json().get('webPages'):
                 website_df = pd.DataFrame(response.json()['webPages']['value'])[columns]
                 website_df['url_id'] = website_df.index + 1
-                website_df = website_df[:self.config.get('source_service').get('bing_search').get('result_count')]
+                website_df = website_df[:self.get_number_of_website_to_fetch()]
             else:
                 website_df = pd.DataFrame(columns=columns + ['url_id'])
         except Exception as ex:
@@ -66,67 +74,266 @@ class BingService:
         """
         # URL 호출 및 텍스트 추출 메서드 (단일 스레드)
         logger.info(f"BingService.call_urls_and_extract_sentences. website_df.shape: {website_df.shape}")
-        name_list, url_list, url_id_list, snippet_list, text_list = [], [], [], [], []
+        site_list, sentences_list = [], []
         for index, row in website_df.iterrows():
             logger.info(f"Processing url: {row['url']}")
-            sentences = self.extract_sentences_from_url(row['url'])
-            for text in sentences:
-                word_count = len(re.findall(r'\w+', text))  # approximate number of words(단어 수 세기)
-                if word_count < 8:
-                    continue
-                name_list.append(row['name'])
-                url_list.append(row['url'])
-                url_id_list.append(row['url_id'])
-                snippet_list.append(row['snippet'])
-                text_list.append(text)
-        text_df = pd.DataFrame(data=zip(name_list, url_list, url_id_list, snippet_list, text_list),
-                               columns=['name', 'url', 'url_id', 'snippet', 'text'])
-        return text_df
+            site_list.append((row['name'], row['url'], row['url_id'], row['snippet']))
+            sentences_list.append(self.extract_sentences_from_url(url=row['url']))
+        return build_text_df(site_list, sentences_list, MIN_WORD_COUNT)
+
+    # 웹페이지를 호출하지 않고 Bing 스니펫을 웹사이트별 유일한 문장으로 사용
+    def get_snippet_text_df(self, website_df) -> pd.DataFrame:
+        """
+        text_df of the snippet-only fast answer: one row = the Bing snippet of one website, no page is fetched
+        columns: same as call_urls_and_extract_sentences
+        """
+        site_list = [(row['name'], row['url'], row['url_id'], row['snippet']) for _, row in website_df.iterrows()]
+        return build_text_df(site_list, [[snippet] if snippet else [] for *_, snippet in site_list])
 
     # # 단일 URL 호출 및 텍스트 추출 메서드
     def call_one_url(self, website_tuple):
         name, url, snippet, url_id = website_tuple
         logger.info(f"Processing url: {url}")
-        sentences = self.extract_sentences_from_url(url)
+        sentences = self.extract_sentences_from_url(url=url)
         logger.info(f"  receive sentences: {len(sentences)}")
         return sentences, name, url, url_id, snippet
 
     # 각 URL을 병렬로 호출하여 텍스트를 추출하고, 이를 데이터프레임으로 반환
     @storage_cached('bing_search_website_content', 'website_df')
     def call_urls_and_extract_sentences_concurrent(self, website_df):
+        logger.info(f"BingService.call_urls_and_extract_sentences_concurrent. website_df.shape: {website_df.shape}")
+        results = sorted(self.iter_results(website_df, 'thread'), key=lambda result: result[3])  # back to url_id order
+        return self.get_text_df_from_results(results)
+
+    # asyncio로 모든 URL을 한 번에 호출하고, 도착한 페이지부터 추출. 마감 시간까지 추출된 페이지만 사용
+    @storage_cached('bing_search_website_content', 'website_df')
+    def call_urls_and_extract_sentences_async(self, website_df):
         logger.info(f"BingService.call_urls_and_extract_sentences_async. website_df.shape: {website_df.shape}")
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            results = list(executor.map(self.call_one_url, website_df.itertuples(index=False)))
-        name_list, url_list, url_id_list, snippet_list, text_list = [], [], [], [], []
-        for result in results:
-            sentences, name, url, url_id, snippet = result
-            sentences = sentences[:self.config['source_service']['bing_search']['sentence_count_per_site']]  # filter top N only for stability
-            for text in sentences:
-                word_count = len(re.findall(r'\w+', text))  # approximate number of words
-                if word_count < 8:
-                    continue
-                name_list.append(name)
-                url_list.append(url)
-                url_id_list.append(url_id)
-                snippet_list.append(snippet)
-                text_list.append(text)
-        text_df = pd.DataFrame(data=zip(name_list, url_list, url_id_list, snippet_list, text_list),
-                               columns=['name', 'url', 'url_id', 'snippet', 'text'])
-        return text_df
+        results = sorted(self.iter_results(website_df, 'async'), key=lambda result: result[3])  # back to url_id order
+        return self.get_text_df_from_results(results)
+
+    # 웹사이트별 문장을 완료되는 순서대로 하나씩 반환 (가장 느린 사이트를 기다리지 않고 다음 단계 시작)
+    def iter_urls_and_extract_sentences(self, website_df):
+        """
+        Yield the text_df of one website at a time, in the order the websites finish
+        columns: same as call_urls_and_extract_sentences_concurrent
+        """
+        logger.info(f"BingService.iter_urls_and_extract_sentences. website_df.shape: {website_df.shape}")
+        for result in self.iter_results(website_df, self.config['source_service']['bing_search']['fetcher']):
+            yield self.get_text_df_from_results([result])
+
+    # hedge 사용 시, result_count개의 웹사이트가 충분한 문장을 주거나 지연 예산이 끝나면 나머지 호출은 취소
+    def iter_results(self, website_df, fetcher: str):
+        """
+        Yield (sentences, name, url, url_id, snippet) of each website in the order they finish
+        hedge: website_df has result_count + extra_count websites (see call_bing_search_api), stop as soon as
+               result_count of them gave at least min_sentence_count usable sentences, or the latency budget expires.
+               url_id stays the Bing rank, thus the citation order does not depend on which websites were fast.
+        """
+        bing_search_config = self.config['source_service']['bing_search']
+        hedge_config = bing_search_config['hedge']
+        deadline = bing_search_config['async_fetcher']['deadline'] if fetcher == 'async' else None
+        if hedge_config['is_enable']:
+            deadline = min(deadline, hedge_config['latency_budget']) if deadline is not None else hedge_config['latency_budget']
+        if fetcher == 'async':
+            results = self.iter_results_async(website_df, deadline)
+        else:
+            results = self.iter_results_concurrent(website_df, deadline)
+        if not hedge_config['is_enable']:
+            yield from results
+            return
+
+        number_of_enough_website = 0
+        try:
+            for result in results:
+                yield result
+                if len(self.get_usable_sentences(result[0])) >= hedge_config['min_sentence_count']:
+                    number_of_enough_website += 1
+                if number_of_enough_website >= bing_search_config['result_count']:
+                    logger.info(f"BingService.iter_results. hedge: {number_of_enough_website} websites are enough, cancel the rest")
+                    break
+        finally:
+            results.close()
+
+    def iter_results_concurrent(self, website_df, deadline: float = None):
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=5)
+        futures = [executor.submit(self.call_one_url, website_tuple) for website_tuple in website_df.itertuples(index=False)]
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout=deadline):
+                yield future.result()
+        except concurrent.futures.TimeoutError:
+            number_of_unfinished = sum(1 for future in futures if not future.done())
+            logger.warning(f"BingService.iter_results_concurrent. deadline {deadline}s reached, unfinished urls: {number_of_unfinished}/{len(futures)}")
+        finally:
+            # do not wait for the unfinished urls(끝나지 않은 URL은 기다리지 않음)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def iter_results_async(self, website_df, deadline: float):
+        """
+        Each page goes to the extraction pool as soon as it arrives, results are yielded in the order extractions finish.
+        The deadline is for the whole stage, fetching and extraction, like the one of iter_results_concurrent.
+        """
+        website_tuple_list = list(website_df.itertuples(index=False))
+        entry_list = [self.get_url_content_entry(website_tuple.url) for website_tuple in website_tuple_list]
+        fetch_index = [i for i, entry in enumerate(entry_list) if entry is None or not entry['is_fresh']]
+
+        def get_result(i, sentences):
+            name, url, snippet, url_id = website_tuple_list[i]
+            logger.info(f"  url: {url}, receive sentences: {len(sentences)}")
+            return sentences, name, url, url_id, snippet
+
+        # fresh pages from the url cache first, no network needed
+        for i in sorted(set(range(len(website_tuple_list))) - set(fetch_index)):
+            yield get_result(i, entry_list[i]['sentences'])
+        end_time = time.monotonic() + deadline
+        fetch_futures = get_async_page_fetcher(self.config).submit_many([website_tuple_list[i].url for i in fetch_index],
+                                                                       [UrlContentCache.get_revalidation_headers(entry_list[i]) for i in fetch_index])
+        fetch_future_dict = dict(zip(fetch_futures, fetch_index))
+        extract_future_dict = {}  # extraction future -> (index, response)
+        pending_future_set = set(fetch_futures)
+        finished_index_set = set()
+        try:
+            while pending_future_set:
+                done_future_set, pending_future_set = concurrent.futures.wait(pending_future_set, timeout=max(0.0, end_time - time.monotonic()),
+                                                                              return_when=concurrent.futures.FIRST_COMPLETED)
+                if not done_future_set:
+                    logger.warning(f"BingService.iter_results_async. deadline {deadline}s reached, unfinished urls: {len(pending_future_set)}/{len(fetch_index)}")
+                    break
+                for future in done_future_set:
+                    if future in fetch_future_dict:
+                        i = fetch_future_dict[future]
+                        response = future.result()
+                        sentences = self.get_sentences_without_extraction(website_tuple_list[i].url, entry_list[i], response)
+                        if sentences is None:
+                            extract_future = self.submit_extract_sentences_from_html(response.content, response.encoding)
+                            extract_future_dict[extract_future] = (i, response)
+                            pending_future_set.add(extract_future)
+                            continue
+                    else:
+                        i, response = extract_future_dict[future]
+                        sentences = self.put_extracted_sentences(website_tuple_list[i].url, response, future.result())
+                    finished_index_set.add(i)
+                    yield get_result(i, sentences)
+        finally:
+            # do not wait for the unfinished urls(끝나지 않은 URL은 기다리지 않음)
+            for future in pending_future_set:
+                future.cancel()
+        # not finished before the deadline: stale copy if any
+        for i in fetch_index:
+            if i not in finished_index_set:
+                yield get_result(i, self.get_sentences_from_response(website_tuple_list[i].url, entry_list[i], None))
+
+    # hedge 사용 시, 여분의 웹사이트까지 요청 (스니펫 전용 모드는 페이지를 호출하지 않으므로 더 많은 검색 결과 사용)
+    def get_number_of_website_to_fetch(self) -> int:
+        if self.config.get('source_service').get('snippet_only').get('is_enable'):
+            return self.config.get('source_service').get('snippet_only').get('result_count')
+        bing_search_config = self.config.get('source_service').get('bing_search')
+        if bing_search_config.get('hedge').get('is_enable'):
+            return bing_search_config.get('result_count') + bing_search_config.get('hedge').get('extra_count')
+        return bing_search_config.get('result_count')
 
+    def get_top_sentences(self, sentences) -> list:
+        return sentences[:self.config['source_service']['bing_search']['sentence_count_per_site']]  # filter top N only for stability
+
+    def get_usable_sentences(self, sentences) -> list:
+        return [text for text in self.get_top_sentences(sentences) if len(re.findall(r'\w+', text)) >= MIN_WORD_COUNT]  # approximate number of words
+
+    def get_text_df_from_results(self, results) -> pd.DataFrame:
+        # columnar build, the word count filter runs once over all sentences(컬럼 단위로 생성, 단어 수 필터는 전체 문장에 한 번에 적용)
+        site_list = [(name, url, url_id, snippet) for _, name, url, url_id, snippet in results]
+        sentences_list = [self.get_top_sentences(sentences) for sentences, *_ in results]
+        return build_text_df(site_list, sentences_list, MIN_WORD_COUNT)
+
+    @single_flight('url_content', 'url')
     def extract_sentences_from_url(self, url):
-        # Fetch the HTML content of the page
+        entry = self.get_url_content_entry(url)
+        if entry is not None and entry['is_fresh']:
+            return entry['sentences']
+
+        # Fetch the HTML content of the page (conditional GET if a stale copy is cached)
         try:
-            response = requests.get(url, timeout=3)
+            response = self.fetch_page(url, UrlContentCache.get_revalidation_headers(entry))
         except:
             logger.error(f"Failed to fetch url: {url}")
-            return []
-        html_content = response.text
+            response = None
+        return self.get_sentences_from_response(url, entry, response)
+
+    # 본문을 스트리밍으로 받아 최대 바이트까지만 보관. HTML이 아니면 본문을 받지 않음
+    def fetch_page(self, url, headers=None):
+        """:return: PageResponse, None if the content type is not html"""
+        bing_search_config = self.config['source_service']['bing_search']
+        max_page_byte = bing_search_config['max_page_byte']
+        with requests.get(url, timeout=3, headers=headers, stream=True) as response:
+            content_type = response.headers.get('Content-Type', '')
+            if not is_allowed_content_type(content_type, bing_search_config['allowed_content_types']):
+                logger.info(f"Skip url of content type {content_type}: {url}")
+                return None
+            chunk_list, size = [], 0
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                chunk_list.append(chunk)
+                size += len(chunk)
+                if size >= max_page_byte:
+                    logger.info(f"Truncate url at {max_page_byte} bytes: {url}")
+                    break
+            # charset only if the server sent it, otherwise detected from the kept bytes instead of the ISO-8859-1 default of requests
+            encoding = response.encoding if 'charset' in content_type.lower() else None
+            return PageResponse(response.status_code, b''.join(chunk_list)[:max_page_byte], encoding, response.headers)
+
+    # html 바이트에서 문장 추출. 프로세스 풀 사용 시, 현재 스레드는 결과를 기다리기만 함 (GIL 점유 없음)
+    def extract_sentences_from_html(self, content: bytes, encoding: str = None) -> list:
+        if self.html_extract_pool is not None:
+            return self.html_extract_pool.extract(content, encoding)
+        return extract_from_html_bytes(self.txt_extract_svc, content, encoding)
+
+    # 추출 완료를 기다리지 않음 (프로세스 풀 미사용 시, 현재 스레드에서 추출)
+    def submit_extract_sentences_from_html(self, content: bytes, encoding: str = None) -> concurrent.futures.Future:
+        if self.html_extract_pool is not None:
+            return self.html_extract_pool.submit(content, encoding)
+        future = concurrent.futures.Future()
+        future.set_result(extract_from_html_bytes(self.txt_extract_svc, content, encoding))
+        return future
+
+    # URL 캐시 조회 (캐시 미사용 또는 처음 보는 URL이면 None)
+    def get_url_content_entry(self, url):
+        if self.url_content_cache is None:
+            return None
+        entry = self.url_content_cache.get(url, self.extract_svc_name)
+        if entry is not None and entry['is_fresh']:
+            self.url_content_cache.count(is_hit=True)
+        return entry
+
+    # 응답(200 / 304 / 실패)과 캐시 항목으로부터 문장을 결정하고 캐시 갱신
+    def get_sentences_from_response(self, url, entry, response) -> list:
+        """
+        :param:
+            entry: cached entry of the url or None
+            response: requests.Response or PageResponse, None if the fetch failed
+        """
+        sentences = self.get_sentences_without_extraction(url, entry, response)
+        if sentences is not None:
+            return sentences
+        return self.put_extracted_sentences(url, response, self.extract_sentences_from_html(response.content, response.encoding))
 
-        # Use BeautifulSoup to parse the HTML and extract the text
-        extract_text = self.txt_extract_svc.extract_from_html(html_content)
-        return extract_text
+    # 추출 없이 정해지는 문장 (실패 / 304 / 오류 페이지), 페이지를 추출해야 하면 None
+    def get_sentences_without_extraction(self, url, entry, response):
+        if response is None:
+            return entry['sentences'] if entry is not None else []  # stale sentences are better than nothing
+        if response.status_code == 304 and entry is not None:
+            self.url_content_cache.mark_revalidated(url, self.extract_svc_name)
+            self.url_content_cache.count(is_revalidated=True)
+            return entry['sentences']
+        if response.status_code != 200:
+            # error pages (403, 429, 5xx) have no content of the site, keep the stale sentences if any(오류 페이지에서는 문장을 추출하지 않음)
+            return entry['sentences'] if entry is not None else []
+        return None
 
+    # 추출한 문장을 URL 캐시에 저장
+    def put_extracted_sentences(self, url, response, sentences) -> list:
+        if self.url_content_cache is not None:
+            self.url_content_cache.count()
+            self.url_content_cache.put(url, self.extract_svc_name, response.content, sentences,
+                                       response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return sentences
 
 if __name__ == '__main__':
     # Load config
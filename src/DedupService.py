@@ -0,0 +1,114 @@
+from hashlib import blake2b
+
+import numpy as np
+import pandas as pd
+
+from LexicalSearchService import tokenize_for_lexical_search
+from Util import setup_logger
+
+logger = setup_logger('DedupService')
+
+SIMHASH_BIT = 64
+SHINGLE_SIZE = 3
+BIT_POSITION = np.arange(SIMHASH_BIT, dtype=np.uint64)
+
+
+def get_simhash(text: str) -> int:
+    """64-bit SimHash over word 3-shingles. Near-identical texts get hashes with a small hamming distance."""
+    tokens = tokenize_for_lexical_search(text)
+    shingles = [' '.join(tokens[i: i + SHINGLE_SIZE]) for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1))]
+    feature_hashes = np.array([int.from_bytes(blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little') for shingle in shingles],
+                              dtype=np.uint64)
+    bits = (feature_hashes[:, None] >> BIT_POSITION) & np.uint64(1)
+    votes = (2 * bits.astype(np.int64) - 1).sum(axis=0)
+    return int(((votes > 0).astype(np.uint64) << BIT_POSITION).sum())
+
+
+def get_band_list(hamming_threshold: int) -> list:
+    """
+    (shift, mask) of the (hamming_threshold + 1) bands of a SimHash, the last band takes the remaining bits
+    Input: 3
+    Output: [(0, 0xffff), (16, 0xffff), (32, 0xffff), (48, 0xffff)]
+    """
+    number_of_band = hamming_threshold + 1
+    band_width = SIMHASH_BIT // number_of_band
+    return [(band * band_width, (1 << (band_width if band < number_of_band - 1 else SIMHASH_BIT - band * band_width)) - 1)
+            for band in range(number_of_band)]
+
+
+class NearDuplicateFilter:
+    """Incremental version of the DedupService clustering: texts near-duplicate to any text seen before are filtered out"""
+
+    def __init__(self, hamming_threshold: int):
+        self.hamming_threshold = hamming_threshold
+        self.band_list = get_band_list(hamming_threshold)
+        self.bucket_dict = {}  # (band, band value) -> simhash list
+
+    def filter(self, texts) -> list:
+        new_text_list = []
+        for text in texts:
+            simhash = get_simhash(text)
+            band_key_list = [(band, (simhash >> shift) & mask) for band, (shift, mask) in enumerate(self.band_list)]
+            if any(bin(simhash ^ seen).count('1') <= self.hamming_threshold for key in band_key_list for seen in self.bucket_dict.get(key, [])):
+                continue
+            for key in band_key_list:
+                self.bucket_dict.setdefault(key, []).append(simhash)
+            new_text_list.append(text)
+        return new_text_list
+
+
+class DedupService:
+    """
+    Near-duplicate sentence elimination with SimHash + LSH banding
+    - the 64 bits are split into (hamming_threshold + 1) bands, two hashes within the threshold share at least one band
+    - candidates sharing a band are clustered when their hamming distance <= hamming_threshold
+    - the first row of each cluster is kept as representative, with the other sources of its duplicates
+      in dup_url_ids and dup_sites [(name, url, snippet)], thus those sources can still be cited
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.hamming_threshold = config.get('semantic_search').get('dedup').get('hamming_threshold')
+
+    def get_cluster_id_list(self, simhash_list) -> list:
+        parent = list(range(len(simhash_list)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for shift, mask in get_band_list(self.hamming_threshold):
+            bucket_dict = {}
+            for i, simhash in enumerate(simhash_list):
+                bucket_dict.setdefault((simhash >> shift) & mask, []).append(i)
+            for bucket in bucket_dict.values():
+                for x in range(len(bucket)):
+                    for y in range(x + 1, len(bucket)):
+                        i, j = bucket[x], bucket[y]
+                        root_i, root_j = find(i), find(j)
+                        if root_i != root_j and bin(simhash_list[i] ^ simhash_list[j]).count('1') <= self.hamming_threshold:
+                            parent[max(root_i, root_j)] = min(root_i, root_j)
+        return [find(i) for i in range(len(simhash_list))]
+
+    def dedup_text_df(self, text_df: pd.DataFrame) -> pd.DataFrame:
+        if not self.config.get('semantic_search').get('dedup').get('is_enable') or len(text_df) == 0:
+            return text_df
+        text_df = text_df.reset_index(drop=True)
+        simhash_list = [get_simhash(text) for text in text_df['text']]
+        cluster_id_list = self.get_cluster_id_list(simhash_list)
+
+        # url_id -> (name, url, snippet) of the sources in each cluster(클러스터별 출처 정보)
+        cluster_site_dict = {}
+        for cluster_id, url_id, name, url, snippet in zip(cluster_id_list, text_df['url_id'], text_df['name'], text_df['url'], text_df['snippet']):
+            cluster_site_dict.setdefault(cluster_id, {}).setdefault(url_id, (name, url, snippet))
+        representative_index = sorted(cluster_site_dict.keys())
+        dedup_text_df = text_df.iloc[representative_index].reset_index(drop=True)
+        dup_url_ids_list = [sorted(url_id for url_id in cluster_site_dict[cluster_id] if url_id != representative_url_id)
+                            for cluster_id, representative_url_id in zip(representative_index, dedup_text_df['url_id'])]
+        dedup_text_df['dup_url_ids'] = dup_url_ids_list
+        dedup_text_df['dup_sites'] = [[cluster_site_dict[cluster_id][url_id] for url_id in dup_url_ids]
+                                      for cluster_id, dup_url_ids in zip(representative_index, dup_url_ids_list)]
+        logger.info(f"DedupService.dedup_text_df. len(text_df): {len(text_df)} -> {len(dedup_text_df)}")
+        return dedup_text_df
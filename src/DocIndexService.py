@@ -0,0 +1,266 @@
+import glob
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from EmbeddingQuantizer import QuantizedEmbeddingMatrix
+from Util import setup_logger, get_project_root, path_safe_string_conversion
+from text_extract.doc import support_doc_type, doc_extract_svc_map
+from text_extract.doc.abc_doc_extract import AbstractDocExtractSvc
+
+logger = setup_logger('DocIndexService')
+
+KMEANS_ITERATION = 10
+KMEANS_MAX_TRAINING_SAMPLE = 50000
+MAX_NUMBER_OF_LIST = 1024
+RETRAIN_GROWTH_RATIO = 2  # re-cluster (no re-embedding) once the live rows double since last training
+
+
+def train_kmeans_centroids(vectors: np.ndarray, number_of_list: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on L2-normalized vectors, returns normalized centroids of shape (number_of_list, dim)"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > KMEANS_MAX_TRAINING_SAMPLE:
+        vectors = vectors[rng.choice(len(vectors), KMEANS_MAX_TRAINING_SAMPLE, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), number_of_list, replace=False)].copy()
+    for _ in range(KMEANS_ITERATION):
+        assignment = assign_to_nearest_centroid(vectors, centroids)
+        for list_id in range(number_of_list):
+            members = vectors[assignment == list_id]
+            if len(members) > 0:
+                centroids[list_id] = members.sum(axis=0)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        centroids /= norms
+    return centroids
+
+
+def assign_to_nearest_centroid(vectors, centroids: np.ndarray, chunk_size: int = 8192) -> np.ndarray:
+    """:param vectors: float32 matrix or QuantizedEmbeddingMatrix"""
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for i in range(0, len(vectors), chunk_size):
+        chunk = vectors[i: i + chunk_size] if isinstance(vectors, np.ndarray) else vectors.take(slice(i, i + chunk_size)).to_float32()
+        assignment[i: i + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignment
+
+
+class IVFIndex:
+    """
+    Inverted file (IVF) index for inner product search on normalized vectors
+    - vectors are bucketed by nearest centroid, each bucket is a contiguous QuantizedEmbeddingMatrix (float32 / float16 / int8)
+    - a query only scores the nprobe buckets closest to it
+    - rows are added or removed by row_id without re-clustering
+    """
+
+    def __init__(self, dim: int, embedding_dtype: str = 'float32'):
+        self.dim = dim
+        self.embedding_dtype = embedding_dtype
+        self.centroids = np.zeros((1, dim), dtype=np.float32)
+        self.list_vectors = [QuantizedEmbeddingMatrix.empty(dim, embedding_dtype)]
+        self.list_row_ids = [np.zeros(0, dtype=np.int64)]
+        self.trained_count = 0
+
+    def __len__(self):
+        return sum(len(row_ids) for row_ids in self.list_row_ids)
+
+    def get_all(self):
+        return QuantizedEmbeddingMatrix.concat(self.list_vectors, self.dim, self.embedding_dtype), np.concatenate(self.list_row_ids)
+
+    def train(self):
+        vectors, row_ids = self.get_all()
+        number_of_list = int(min(MAX_NUMBER_OF_LIST, max(1, np.sqrt(len(vectors)))))
+        logger.info(f"IVFIndex.train. number_of_vector: {len(vectors)}, number_of_list: {number_of_list}")
+        if len(vectors) > 0:
+            sample_index = np.random.default_rng(0).permutation(len(vectors))[:KMEANS_MAX_TRAINING_SAMPLE]
+            self.centroids = train_kmeans_centroids(vectors.take(np.sort(sample_index)).to_float32(), number_of_list)
+        self.list_vectors = [QuantizedEmbeddingMatrix.empty(self.dim, self.embedding_dtype) for _ in range(len(self.centroids))]
+        self.list_row_ids = [np.zeros(0, dtype=np.int64) for _ in range(len(self.centroids))]
+        self.trained_count = len(vectors)
+        self.add(vectors, row_ids)
+
+    def add(self, vectors: QuantizedEmbeddingMatrix, row_ids: np.ndarray):
+        if len(vectors) == 0:
+            return
+        assignment = assign_to_nearest_centroid(vectors, self.centroids)
+        for list_id in np.unique(assignment):
+            mask = assignment == list_id
+            self.list_vectors[list_id] = QuantizedEmbeddingMatrix.concat([self.list_vectors[list_id], vectors.take(mask)], self.dim, self.embedding_dtype)
+            self.list_row_ids[list_id] = np.concatenate([self.list_row_ids[list_id], row_ids[mask]])
+        if len(self) > RETRAIN_GROWTH_RATIO * max(self.trained_count, 1) and len(self) >= 4:
+            self.train()
+
+    def remove(self, row_ids):
+        row_ids = np.asarray(list(row_ids), dtype=np.int64)
+        if len(row_ids) == 0:
+            return
+        for list_id in range(len(self.centroids)):
+            keep = ~np.isin(self.list_row_ids[list_id], row_ids)
+            if not keep.all():
+                self.list_vectors[list_id] = self.list_vectors[list_id].take(keep)
+                self.list_row_ids[list_id] = self.list_row_ids[list_id][keep]
+
+    def search(self, query_embedding: np.ndarray, k: int, nprobe: int):
+        """:return: (row_ids, scores) of the k nearest rows, best first"""
+        nprobe = min(nprobe, len(self.centroids))
+        probe_list_ids = np.argpartition(-(self.centroids @ query_embedding), nprobe - 1)[:nprobe]
+        row_id_list, score_list = [], []
+        for list_id in probe_list_ids:
+            if len(self.list_row_ids[list_id]) > 0:
+                row_id_list.append(self.list_row_ids[list_id])
+                score_list.append(self.list_vectors[list_id].dot(query_embedding))
+        if not row_id_list:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        row_ids, scores = np.concatenate(row_id_list), np.concatenate(score_list)
+        k = min(k, len(scores))
+        top_k_index = np.argpartition(-scores, k - 1)[:k]
+        top_k_index = top_k_index[np.argsort(-scores[top_k_index], kind='stable')]
+        return row_ids[top_k_index], scores[top_k_index]
+
+
+class DocIndexService:
+    """
+    Persistent ANN index of the sentences of doc_search_path
+    - stored in one pickle under source_service.doc_index.path (next to .cache), one file per embedding model and dtype
+    - sync() only extracts and embeds new or modified files, and drops deleted ones
+    """
+
+    def __init__(self, config, embedding_model: str):
+        self.config = config
+        doc_index_config = config.get('source_service').get('doc_index')
+        self.nprobe = doc_index_config.get('nprobe')
+        self.sync_interval = doc_index_config.get('sync_interval')
+        self.embedding_dtype = config.get('semantic_search').get('embedding_dtype')
+        index_file_name = f"doc_index_{path_safe_string_conversion(embedding_model)}_{self.embedding_dtype}.pickle"
+        self.index_file_path = Path(get_project_root(), doc_index_config.get('path'), index_file_name)
+
+        self.lock = threading.Lock()
+        self.index = None
+        self.file_dict = {}  # file_path -> {'mtime', 'size', 'row_ids'}
+        self.sentence_dict = {}  # row_id -> (file_path, text)
+        self.next_row_id = 0
+        self.last_sync_time = 0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.index_file_path):
+            return
+        with open(self.index_file_path, 'rb') as f:
+            saved = pickle.load(f)
+        self.index, self.file_dict, self.sentence_dict, self.next_row_id = saved['index'], saved['file_dict'], saved['sentence_dict'], saved['next_row_id']
+        logger.info(f"DocIndexService.load. number_of_file: {len(self.file_dict)}, number_of_sentence: {len(self.sentence_dict)}")
+
+    def save(self):
+        os.makedirs(self.index_file_path.parent, exist_ok=True)
+        tmp_path = self.index_file_path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'index': self.index, 'file_dict': self.file_dict, 'sentence_dict': self.sentence_dict, 'next_row_id': self.next_row_id},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.index_file_path)  # atomic, other workers never read a half-written index
+
+    @staticmethod
+    def list_doc_files(doc_search_path) -> dict:
+        files_grabbed = dict()
+        for doc_type in support_doc_type:
+            for file_path in glob.glob(doc_search_path + os.sep + "*." + doc_type):
+                stat = os.stat(file_path)
+                files_grabbed[file_path] = {'doc_type': doc_type, 'mtime': stat.st_mtime, 'size': stat.st_size}
+        return files_grabbed
+
+    def sync(self, semantic_search_service, force=False):
+        """Bring the index up to date with doc_search_path. Only changed files are re-extracted and re-embedded."""
+        if not force and time.time() - self.last_sync_time < self.sync_interval:
+            return
+        files_grabbed = self.list_doc_files(self.config['source_service']['doc_search_path'])
+        removed_file_list = [file_path for file_path, file in self.file_dict.items()
+                             if file_path not in files_grabbed or (files_grabbed[file_path]['mtime'], files_grabbed[file_path]['size']) != (file['mtime'], file['size'])]
+        added_file_list = [file_path for file_path in files_grabbed.keys() if file_path not in self.file_dict or file_path in removed_file_list]
+
+        if removed_file_list:
+            removed_row_ids = [row_id for file_path in removed_file_list for row_id in self.file_dict.pop(file_path)['row_ids']]
+            if self.index is not None:
+                self.index.remove(removed_row_ids)
+            for row_id in removed_row_ids:
+                self.sentence_dict.pop(row_id)
+
+        # added files are recorded only after their vectors are in the index, a failed embedding call is retried by the next sync
+        # (임베딩이 인덱스에 추가된 후에만 파일을 기록)
+        text_list, row_id_list = [], []
+        pending_file_dict, pending_sentence_dict = {}, {}
+        next_row_id = self.next_row_id
+        for file_path in added_file_list:
+            extract_svc: AbstractDocExtractSvc = doc_extract_svc_map[files_grabbed[file_path]['doc_type']]
+            sentence_list = [sentence.replace("\n", " ") for sentence in extract_svc.extract_from_doc(file_path) if sentence.strip()]
+            row_ids = list(range(next_row_id, next_row_id + len(sentence_list)))
+            next_row_id += len(sentence_list)
+            pending_file_dict[file_path] = {'mtime': files_grabbed[file_path]['mtime'], 'size': files_grabbed[file_path]['size'], 'row_ids': row_ids}
+            pending_sentence_dict.update({row_id: (file_path, sentence) for row_id, sentence in zip(row_ids, sentence_list)})
+            text_list.extend(sentence_list)
+            row_id_list.extend(row_ids)
+
+        if text_list:
+            embedding_matrix = semantic_search_service.get_embedding_matrix(text_list)
+            if self.index is None:
+                self.index = IVFIndex(embedding_matrix.shape[1], self.embedding_dtype)
+            self.index.add(QuantizedEmbeddingMatrix.from_float32(embedding_matrix, self.embedding_dtype), np.array(row_id_list, dtype=np.int64))
+        self.file_dict.update(pending_file_dict)
+        self.sentence_dict.update(pending_sentence_dict)
+        self.next_row_id = next_row_id
+
+        if removed_file_list or added_file_list:
+            logger.info(f"DocIndexService.sync. removed file: {len(removed_file_list)}, added file: {len(added_file_list)}, added sentence: {len(text_list)}")
+            self.save()
+        self.last_sync_time = time.time()
+
+    def search_doc_text_df(self, semantic_search_service, search_text, start_doc_id: int, k: int) -> pd.DataFrame:
+        """Top k sentences of the indexed documents, one url_id per file in order of its best sentence"""
+        with self.lock:
+            self.sync(semantic_search_service)
+            if self.index is None or len(self.index) == 0:
+                return pd.DataFrame([])
+            query_embedding = semantic_search_service.get_embedding_matrix([search_text])[0]
+            row_ids, _ = self.index.search(query_embedding, k, self.nprobe)
+            sentence_list = [self.sentence_dict[row_id] for row_id in row_ids]
+
+        doc_id_dict = {}
+        doc_sentence_list = []
+        for file_path, sentence in sentence_list:
+            doc_id = doc_id_dict.setdefault(file_path, start_doc_id + len(doc_id_dict))
+            doc_sentence_list.append({
+                'name': file_path.split(os.sep)[-1],
+                'url': file_path,
+                'url_id': doc_id,
+                'snippet': '',
+                'text': sentence
+            })
+        return pd.DataFrame(doc_sentence_list)
+
+
+# one index per file per process, shared by all requests(프로세스 당 하나의 인덱스를 공유)
+doc_index_service_dict = {}
+doc_index_service_dict_lock = threading.Lock()
+
+
+def get_doc_index_service(config, embedding_model: str) -> DocIndexService:
+    doc_index_config = config.get('source_service').get('doc_index')
+    key = (doc_index_config.get('path'), embedding_model, config.get('semantic_search').get('embedding_dtype'))
+    with doc_index_service_dict_lock:
+        if key not in doc_index_service_dict:
+            doc_index_service_dict[key] = DocIndexService(config, embedding_model)
+        return doc_index_service_dict[key]
+
+
+if __name__ == '__main__':
+    # Build or update the index of doc_search_path offline
+    from SemanticSearchService import SemanticSearchServiceFactory
+
+    with open(os.path.join(get_project_root(), 'src/config/config.yaml'), encoding='utf-8') as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+        semantic_search_service = SemanticSearchServiceFactory.create_semantic_search_service(config)
+        doc_index_service = get_doc_index_service(config, semantic_search_service.embedding_model)
+        doc_index_service.sync(semantic_search_service, force=True)
+        print(doc_index_service.search_doc_text_df(semantic_search_service, 'What is ChatGPT', start_doc_id=1, k=10))
@@ -0,0 +1,77 @@
+import concurrent.futures
+
+import openai
+
+from RateLimitScheduler import RateLimitScheduler, get_current_priority
+from TokenizerService import get_tokenizer_service
+from Util import setup_logger
+
+logger = setup_logger('EmbeddingBatchScheduler')
+
+
+def pack_batches_by_token(token_count_list, max_token_per_batch: int, max_text_per_batch: int) -> list:
+    """
+    Greedily pack consecutive texts into batches under both the token and the text count limit
+    Input: token_count_list=[5, 5, 5, 9, 1], max_token_per_batch=10, max_text_per_batch=2
+    Output: [[0, 1], [2], [3, 4]]
+    """
+    batches, batch, batch_token = [], [], 0
+    for i, token_count in enumerate(token_count_list):
+        if batch and (batch_token + token_count > max_token_per_batch or len(batch) >= max_text_per_batch):
+            batches.append(batch)
+            batch, batch_token = [], 0
+        batch.append(i)
+        batch_token += token_count
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class EmbeddingBatchScheduler:
+    """
+    Send embedding requests in token-packed batches, concurrently on a bounded thread pool
+    - texts longer than max_token_per_text are truncated so one paragraph cannot fail a whole batch
+    - batches go through the shared rate limit scheduler (token buckets, priority, retries), results are returned in the original order
+    """
+
+    def __init__(self, model: str, max_token_per_text: int, max_token_per_batch: int, max_text_per_batch: int,
+                 max_workers: int, rate_limit_scheduler: RateLimitScheduler):
+        self.model = model
+        self.max_token_per_text = max_token_per_text
+        self.max_token_per_batch = max_token_per_batch
+        self.max_text_per_batch = max_text_per_batch
+        self.max_workers = max_workers
+        self.rate_limit_scheduler = rate_limit_scheduler
+
+    def truncate_and_count_tokens(self, texts):
+        encoding = get_tokenizer_service(self.model).encoding  # loaded once per process
+        truncated_texts, token_count_list = [], []
+        for text, tokens in zip(texts, encoding.encode_batch(texts)):
+            if len(tokens) > self.max_token_per_text:
+                tokens = tokens[:self.max_token_per_text]
+                text = encoding.decode(tokens)
+            truncated_texts.append(text)
+            token_count_list.append(len(tokens))
+        return truncated_texts, token_count_list
+
+    def call_one_batch(self, batch_texts, batch_token: int, priority: int):
+        response = self.rate_limit_scheduler.run(lambda: openai.Embedding.create(input=batch_texts, engine=self.model),
+                                                 token_count=batch_token, priority=priority)
+        return [r["embedding"] for r in sorted(response["data"], key=lambda r: r["index"])]
+
+    def run(self, texts) -> list:
+        if len(texts) == 0:
+            return []
+        texts, token_count_list = self.truncate_and_count_tokens(texts)
+        batches = pack_batches_by_token(token_count_list, self.max_token_per_batch, self.max_text_per_batch)
+        logger.info(f"EmbeddingBatchScheduler.run. len(texts): {len(texts)}, number_of_token: {sum(token_count_list)}, number_of_batch: {len(batches)}")
+        priority = get_current_priority()  # pool threads do not inherit the context of the caller
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self.call_one_batch, [[texts[i] for i in batch] for batch in batches],
+                                        [sum(token_count_list[i] for i in batch) for batch in batches], [priority] * len(batches)))
+
+        embeddings = [None] * len(texts)
+        for batch, batch_embeddings in zip(batches, results):
+            for i, embedding in zip(batch, batch_embeddings):
+                embeddings[i] = embedding
+        return embeddings
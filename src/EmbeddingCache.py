@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import threading
+import time
+from hashlib import md5
+from pathlib import Path
+
+from EmbeddingQuantizer import encode_vector, decode_vector
+from Util import setup_logger, get_project_root
+
+logger = setup_logger('EmbeddingCache')
+
+SQLITE_MAX_VARIABLE_CHUNK = 500  # stay below SQLITE_MAX_VARIABLE_NUMBER of old sqlite builds
+
+
+def normalize_text_for_embedding(text: str) -> str:
+    """
+    Normalize text before hashing so that whitespace-only differences share one cache entry
+    Input: "  ChatGPT is\n a  chatbot "
+    Output: "ChatGPT is a chatbot"
+    """
+    return ' '.join(text.split())
+
+
+def get_text_hash(text: str) -> str:
+    return md5(normalize_text_for_embedding(text).encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store on local disk (sqlite)
+    - key: (model, md5 of normalized text)
+    - value: embedding vector as float32 / float16 / int8 bytes, the dtype is stored per row
+    - eviction: least recently used rows are deleted once max_number_of_embedding is exceeded
+    """
+
+    def __init__(self, db_path: Path, max_number_of_embedding: int = 100000, embedding_dtype: str = 'float32'):
+        self.db_path = db_path
+        self.max_number_of_embedding = max_number_of_embedding
+        self.embedding_dtype = embedding_dtype
+        self.hit_count = 0
+        self.miss_count = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(db_path.parent, exist_ok=True)
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS embedding ('
+                          'model TEXT NOT NULL, '
+                          'text_hash TEXT NOT NULL, '
+                          'vector BLOB NOT NULL, '
+                          'dtype TEXT NOT NULL DEFAULT \'float32\', '
+                          'last_access REAL NOT NULL, '
+                          'PRIMARY KEY (model, text_hash))')
+        if 'dtype' not in [column[1] for column in self.conn.execute('PRAGMA table_info(embedding)').fetchall()]:
+            self.conn.execute('ALTER TABLE embedding ADD COLUMN dtype TEXT NOT NULL DEFAULT \'float32\'')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_embedding_last_access ON embedding (last_access)')
+        self.conn.commit()
+
+    def get_many(self, model: str, texts: list) -> list:
+        """
+        Look up embeddings of texts. Result is in the same order as texts, None for cache misses.
+        """
+        hash_list = [get_text_hash(text) for text in texts]
+        unique_hash_list = list(dict.fromkeys(hash_list))
+        found = {}
+        with self.lock:
+            for i in range(0, len(unique_hash_list), SQLITE_MAX_VARIABLE_CHUNK):
+                chunk = unique_hash_list[i: i + SQLITE_MAX_VARIABLE_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(f'SELECT text_hash, vector, dtype FROM embedding WHERE model = ? AND text_hash IN ({placeholders})',
+                                         [model] + chunk).fetchall()
+                found.update({text_hash: decode_vector(vector, dtype) for text_hash, vector, dtype in rows})
+            if found:
+                now = time.time()
+                self.conn.executemany('UPDATE embedding SET last_access = ? WHERE model = ? AND text_hash = ?',
+                                      [(now, model, text_hash) for text_hash in found.keys()])
+                self.conn.commit()
+
+            result = [found.get(text_hash) for text_hash in hash_list]
+            number_of_hit = sum(1 for embedding in result if embedding is not None)
+            self.hit_count += number_of_hit
+            self.miss_count += len(result) - number_of_hit
+        return result
+
+    def put_many(self, model: str, texts: list, embeddings: list):
+        now = time.time()
+        rows = [(model, get_text_hash(text), encode_vector(embedding, self.embedding_dtype), self.embedding_dtype, now)
+                for text, embedding in zip(texts, embeddings)]
+        with self.lock:
+            self.conn.executemany('INSERT OR REPLACE INTO embedding (model, text_hash, vector, dtype, last_access) VALUES (?, ?, ?, ?, ?)', rows)
+            self.conn.commit()
+            self.evict_least_recently_used()
+
+    def evict_least_recently_used(self):
+        number_of_embedding = self.conn.execute('SELECT COUNT(*) FROM embedding').fetchone()[0]
+        number_to_evict = number_of_embedding - self.max_number_of_embedding
+        if number_to_evict <= 0:
+            return
+        logger.info(f"EmbeddingCache.evict_least_recently_used. number_to_evict: {number_to_evict}")
+        self.conn.execute('DELETE FROM embedding WHERE rowid IN (SELECT rowid FROM embedding ORDER BY last_access ASC LIMIT ?)', (number_to_evict,))
+        self.conn.commit()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            number_of_embedding = self.conn.execute('SELECT COUNT(*) FROM embedding').fetchone()[0]
+        total_count = self.hit_count + self.miss_count
+        return {'hit_count': self.hit_count,
+                'miss_count': self.miss_count,
+                'hit_rate': self.hit_count / total_count if total_count > 0 else 0.0,
+                'number_of_embedding': number_of_embedding,
+                'max_number_of_embedding': self.max_number_of_embedding}
+
+
+# one store per db file per process, shared by all requests(프로세스 당 하나의 캐시 인스턴스를 공유)
+embedding_cache_dict = {}
+embedding_cache_dict_lock = threading.Lock()
+
+
+def get_embedding_cache(config) -> EmbeddingCache:
+    cache_config = config.get('cache')
+    db_path = Path(get_project_root(), cache_config.get('path'), 'embedding', 'embedding.sqlite3')
+    with embedding_cache_dict_lock:
+        if db_path not in embedding_cache_dict:
+            embedding_cache_dict[db_path] = EmbeddingCache(db_path, cache_config.get('max_number_of_embedding'), cache_config.get('embedding_dtype'))
+        return embedding_cache_dict[db_path]
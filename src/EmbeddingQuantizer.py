@@ -0,0 +1,114 @@
+import numpy as np
+
+SUPPORTED_EMBEDDING_DTYPE = ['float32', 'float16', 'int8']
+INT8_MAX = 127
+DOT_CHUNK_SIZE = 4096  # rows dequantized at once, bounds the float32 temporary memory
+
+
+def quantize_rows(matrix: np.ndarray, dtype: str):
+    """
+    Quantize a float32 matrix row by row
+    - float16: plain cast, scale is None
+    - int8: symmetric scalar quantization, row i is approximated by data[i] * scale[i]
+    :return: (data, scale)
+    """
+    if dtype == 'float32':
+        return np.ascontiguousarray(matrix, dtype=np.float32), None
+    if dtype == 'float16':
+        return matrix.astype(np.float16), None
+    if dtype == 'int8':
+        scale = np.abs(matrix).max(axis=1) / INT8_MAX
+        scale[scale == 0] = 1
+        data = np.rint(matrix / scale[:, None]).astype(np.int8)
+        return data, scale.astype(np.float32)
+    raise NotImplementedError(f'embedding dtype - {dtype} - is not supported')
+
+
+def dequantize_rows(data: np.ndarray, scale) -> np.ndarray:
+    matrix = data.astype(np.float32)
+    if scale is not None:
+        matrix *= scale[:, None]
+    return matrix
+
+
+def encode_vector(vector, dtype: str) -> bytes:
+    """Serialize one embedding for a persisted store. int8 is prefixed by its float32 scale."""
+    data, scale = quantize_rows(np.asarray(vector, dtype=np.float32)[None, :], dtype)
+    return (scale.tobytes() if scale is not None else b'') + data.tobytes()
+
+
+def decode_vector(blob: bytes, dtype: str) -> np.ndarray:
+    if dtype == 'float32':
+        return np.frombuffer(blob, dtype=np.float32)
+    if dtype == 'float16':
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    if dtype == 'int8':
+        scale = np.frombuffer(blob[:4], dtype=np.float32)[0]
+        return np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * scale
+    raise NotImplementedError(f'embedding dtype - {dtype} - is not supported')
+
+
+class QuantizedEmbeddingMatrix:
+    """
+    Embedding matrix stored as float32 / float16 / int8 (+ per-row scale)
+    Scoring dequantizes DOT_CHUNK_SIZE rows at a time, thus memory stays at the compact size.
+    """
+
+    def __init__(self, data: np.ndarray, scale, dtype: str):
+        self.data = data
+        self.scale = scale
+        self.dtype = dtype
+
+    @staticmethod
+    def from_float32(matrix: np.ndarray, dtype: str) -> 'QuantizedEmbeddingMatrix':
+        data, scale = quantize_rows(matrix, dtype)
+        return QuantizedEmbeddingMatrix(data, scale, dtype)
+
+    @staticmethod
+    def from_rows(rows, dim: int, dtype: str, is_normalize: bool = True) -> 'QuantizedEmbeddingMatrix':
+        """Build from a list of 1-d vectors chunk by chunk, without materializing the whole float32 matrix"""
+        chunk_list = []
+        for i in range(0, len(rows), DOT_CHUNK_SIZE):
+            chunk = np.array(rows[i: i + DOT_CHUNK_SIZE], dtype=np.float32)
+            if is_normalize:
+                norms = np.linalg.norm(chunk, axis=1, keepdims=True)
+                norms[norms == 0] = 1
+                chunk /= norms
+            chunk_list.append(QuantizedEmbeddingMatrix.from_float32(chunk, dtype))
+        return QuantizedEmbeddingMatrix.concat(chunk_list, dim, dtype)
+
+    @staticmethod
+    def empty(dim: int, dtype: str) -> 'QuantizedEmbeddingMatrix':
+        return QuantizedEmbeddingMatrix.from_float32(np.zeros((0, dim), dtype=np.float32), dtype)
+
+    @staticmethod
+    def concat(matrix_list, dim: int, dtype: str) -> 'QuantizedEmbeddingMatrix':
+        matrix_list = [matrix for matrix in matrix_list if len(matrix) > 0]
+        if not matrix_list:
+            return QuantizedEmbeddingMatrix.empty(dim, dtype)
+        data = np.concatenate([matrix.data for matrix in matrix_list])
+        scale = np.concatenate([matrix.scale for matrix in matrix_list]) if dtype == 'int8' else None
+        return QuantizedEmbeddingMatrix(data, scale, dtype)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def take(self, index) -> 'QuantizedEmbeddingMatrix':
+        return QuantizedEmbeddingMatrix(self.data[index], self.scale[index] if self.scale is not None else None, self.dtype)
+
+    def to_float32(self) -> np.ndarray:
+        return dequantize_rows(self.data, self.scale)
+
+    def dot(self, vector: np.ndarray) -> np.ndarray:
+        if self.dtype == 'float32':
+            return self.data @ vector
+        scores = np.empty(len(self.data), dtype=np.float32)
+        for i in range(0, len(self.data), DOT_CHUNK_SIZE):
+            scores[i: i + DOT_CHUNK_SIZE] = self.data[i: i + DOT_CHUNK_SIZE].astype(np.float32) @ vector
+        if self.scale is not None:
+            scores *= self.scale
+        return scores
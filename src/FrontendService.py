@@ -2,6 +2,7 @@ import os
 import re
 from urllib.parse import urlparse
 
+import pandas as pd
 import yaml
 
 from NLPUtil import split_with_delimiters, get_longest_common_word_sequences
@@ -39,10 +40,35 @@ class FrontendService:
         def create_source_json_object(footnote, domain, url, title, text):
             return {"footnote": footnote, "domain": domain, "url": url, "title": title, "text": text}
 
+        # 중복 제거된 문장의 다른 출처도 표시 (DedupService)
+        # - other sources are listed under the shared sentence
+        # - [k] -> [k][d] only if source d has every in-scope sentence of source k, otherwise d could be credited with a claim it never made
+        def add_duplicate_source(response_text, gpt_input_text_df):
+            if 'dup_url_ids' not in gpt_input_text_df.columns:
+                return response_text, gpt_input_text_df, []
+            cited_url_id_set = {int(x) for x in re.findall(r'\[([0-9]+)\]', response_text)}
+            in_scope_df = gpt_input_text_df[gpt_input_text_df['in_scope'] & gpt_input_text_df['url_id'].isin(cited_url_id_set)]
+            shared_url_ids_dict = {}  # cited url_id -> url_ids of the other sources having all of its sentences in the prompt
+            dup_row_list = []  # one row per (sentence, other source), listed under that source
+            for row in in_scope_df.itertuples(index=False):
+                dup_url_id_set = set(row.dup_url_ids)
+                shared_url_ids_dict[row.url_id] = shared_url_ids_dict.get(row.url_id, dup_url_id_set) & dup_url_id_set
+                for dup_url_id, (name, url, snippet) in zip(row.dup_url_ids, row.dup_sites):
+                    dup_row_list.append({'docno': row.docno, 'name': name, 'url': url, 'url_id': dup_url_id, 'snippet': snippet,
+                                         'text': row.text, 'in_scope': True})
+            if not dup_row_list:
+                return response_text, gpt_input_text_df, []
+            response_text = re.sub(r'\[([0-9]+)\]', lambda x: x.group(0) + ''.join(f"[{url_id}]" for url_id in sorted(shared_url_ids_dict.get(int(x.group(1)), []))),
+                                   response_text)
+            dup_url_id_list = list(dict.fromkeys(dup_row['url_id'] for dup_row in dup_row_list))
+            source_df = gpt_input_text_df[['docno', 'name', 'url', 'url_id', 'snippet', 'text', 'in_scope']].astype({'name': object, 'url': object, 'snippet': object})
+            return response_text, pd.concat([source_df, pd.DataFrame(dup_row_list)], ignore_index=True), dup_url_id_list
+
         # 응답 텍스트에서 URL ID 재정렬
-        def reorder_url_id(response_text, gpt_input_text_df):
+        # listed_url_id_list: sources listed without a citation in the text, numbered after the cited ones
+        def reorder_url_id(response_text, gpt_input_text_df, listed_url_id_list=()):
             # response_text: find reference in text & re-order(응답 텍스트에서 URL ID 추출 및 정렬)
-            url_id_list = [int(x) for x in dict.fromkeys(re.findall(r'\[([0-9]+)\]', response_text))]
+            url_id_list = list(dict.fromkeys([int(x) for x in re.findall(r'\[([0-9]+)\]', response_text)] + list(listed_url_id_list)))
             url_id_map = dict(zip(url_id_list, range(1, len(url_id_list) + 1)))
 
             # 응답 텍스트에서 URL ID를 재정렬된 값으로 변경
@@ -133,8 +159,9 @@ class FrontendService:
             source_explain_json = get_explain_json(source_text, word_color_dict)
             return response_explain_json, source_explain_json
 
+        response_text, gpt_input_text_df, dup_url_id_list = add_duplicate_source(response_text, gpt_input_text_df)
         # URL ID 재정렬 및 데이터프레임 업데이트
-        response_text, in_scope_source_df = reorder_url_id(response_text, gpt_input_text_df)
+        response_text, in_scope_source_df = reorder_url_id(response_text, gpt_input_text_df, dup_url_id_list)
         # 응답 JSON 객체 생성
         response_json = get_response_json(response_text)
         # 소스 JSON 객체 생성
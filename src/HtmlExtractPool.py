@@ -0,0 +1,164 @@
+import concurrent.futures
+import multiprocessing
+import queue
+import re
+import threading
+
+from charset_normalizer import from_bytes
+
+from Util import setup_logger
+from text_extract.html import html_extract_svc_class_map
+
+logger = setup_logger('HtmlExtractPool')
+
+# a worker keeps its extractor (and the trafilatura caches) warm across pages
+WORKER_EXTRACT_SVC_KWARGS = {'trafilatura': {'reset_cache_interval': 50}}
+META_CHARSET_PATTERN = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+META_CHARSET_SEARCH_SIZE = 4096  # <meta charset> must be in the first bytes of a page
+WORKER_READY = 'ready'
+
+
+def decode_html(content: bytes, encoding: str = None) -> str:
+    """
+    Decode html bytes with the charset given by the server.
+    If the server did not send any: <meta charset> of the page, then the detected charset.
+    """
+    if encoding is None:
+        meta_charset = META_CHARSET_PATTERN.search(content[:META_CHARSET_SEARCH_SIZE])
+        if meta_charset is not None:
+            encoding = meta_charset.group(1).decode('ascii')
+        else:
+            best_match = from_bytes(content).best()
+            encoding = best_match.encoding if best_match is not None else 'utf-8'
+    try:
+        return content.decode(encoding, errors='replace')
+    except LookupError:  # unknown charset name in the header
+        return content.decode('utf-8', errors='replace')
+
+
+def extract_from_html_bytes(extract_svc, content: bytes, encoding: str = None) -> list:
+    return extract_svc.extract_from_html(decode_html(content, encoding))
+
+
+# extractor of the current worker process(워커 프로세스 당 하나의 추출기)
+worker_extract_svc = None
+
+
+def init_worker(extract_svc_name: str):
+    global worker_extract_svc
+    worker_extract_svc = html_extract_svc_class_map[extract_svc_name](**WORKER_EXTRACT_SVC_KWARGS.get(extract_svc_name, {}))
+
+
+def extract_in_worker(content: bytes, encoding: str = None) -> list:
+    return extract_from_html_bytes(worker_extract_svc, content, encoding)
+
+
+def run_worker(extract_svc_name: str, connection):
+    """Main loop of a worker process: (content, encoding) -> (sentences, None) or (None, exception)"""
+    init_worker(extract_svc_name)
+    connection.send(WORKER_READY)
+    while True:
+        try:
+            content, encoding = connection.recv()
+        except EOFError:  # the pool is gone
+            return
+        try:
+            connection.send((extract_in_worker(content, encoding), None))
+        except Exception as ex:
+            try:
+                connection.send((None, ex))
+            except Exception:  # the exception itself is not picklable
+                connection.send((None, RuntimeError(f"{type(ex).__name__}: {ex}")))
+
+
+class ExtractWorker:
+    """One worker process and its pipe, used by one thread at a time (see HtmlExtractPool)"""
+
+    def __init__(self, extract_svc_name: str):
+        self.extract_svc_name = extract_svc_name
+        self.start()
+
+    def start(self):
+        # 'spawn': forking a parent with running threads / event loop is avoided
+        context = multiprocessing.get_context('spawn')
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(target=run_worker, args=(self.extract_svc_name, worker_connection), daemon=True)
+        self.process.start()
+        worker_connection.close()
+        self.is_ready = False
+
+    def restart(self):
+        # a worker hanging on a page would never read the next one: stop the process, not only the pipe(멈춘 워커 프로세스 종료)
+        self.process.terminate()
+        self.process.join(timeout=1)
+        self.connection.close()
+        self.start()
+
+    def extract(self, content: bytes, encoding: str, timeout: float) -> list:
+        """
+        timeout: seconds of the extraction only, the start-up of the process is not counted
+        raise TimeoutError if the page takes longer, EOFError / OSError if the process died
+        """
+        if not self.is_ready:
+            self.connection.recv()  # WORKER_READY, after the extractor is created
+            self.is_ready = True
+        self.connection.send((content, encoding))
+        if not self.connection.poll(timeout):
+            raise TimeoutError()
+        sentences, ex = self.connection.recv()
+        if ex is not None:
+            raise ex
+        return sentences
+
+
+class HtmlExtractPool:
+    """
+    HTML -> sentences extraction on worker processes
+    - parsing is CPU-bound, in worker processes it runs outside the GIL of the fetcher / request threads
+    - html bytes are handed over as they are, decoding runs in the worker as well
+    - extract_timeout is per page, from the moment a worker starts on it. Waiting for a free worker is not counted,
+      and a page over time restarts only its own worker, pages of other requests on the other workers are not affected
+    """
+
+    def __init__(self, extract_svc_name: str, max_workers: int, extract_timeout: float):
+        self.extract_svc_name = extract_svc_name
+        self.max_workers = max_workers
+        self.extract_timeout = extract_timeout
+        self.idle_worker_queue = queue.Queue()
+        for _ in range(max_workers):
+            self.idle_worker_queue.put(ExtractWorker(extract_svc_name))
+        # for submit: one thread per worker, waits for the result of its page outside the caller thread
+        self.submit_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='HtmlExtractPool')
+
+    def extract(self, content: bytes, encoding: str = None) -> list:
+        worker = self.idle_worker_queue.get()
+        try:
+            return worker.extract(content, encoding, self.extract_timeout)
+        except TimeoutError:
+            # a page hanging the parser would hold the worker and the fetching thread forever: drop the page, restart the worker
+            logger.error(f"HtmlExtractPool.extract. no result in {self.extract_timeout}s, restarting the worker")
+            worker.restart()
+            return []
+        except (EOFError, OSError):
+            # the worker died (e.g. parser crash on a broken page): drop the page, restart the worker for the next ones
+            logger.error("HtmlExtractPool.extract. worker process died, restarting the worker")
+            worker.restart()
+            return []
+        finally:
+            self.idle_worker_queue.put(worker)
+
+    def submit(self, content: bytes, encoding: str = None) -> concurrent.futures.Future:
+        """Non-blocking extract, e.g. for the async fetcher: the future has the sentences of the page"""
+        return self.submit_executor.submit(self.extract, content, encoding)
+
+
+# one pool per process, shared by all requests(프로세스 당 하나의 풀을 공유)
+html_extract_pool_dict = {}
+html_extract_pool_dict_lock = threading.Lock()
+
+
+def get_html_extract_pool(extract_svc_name: str, max_workers: int, extract_timeout: float) -> HtmlExtractPool:
+    with html_extract_pool_dict_lock:
+        if extract_svc_name not in html_extract_pool_dict:
+            html_extract_pool_dict[extract_svc_name] = HtmlExtractPool(extract_svc_name, max_workers, extract_timeout)
+        return html_extract_pool_dict[extract_svc_name]
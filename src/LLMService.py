@@ -1,12 +1,14 @@
 import os
 from abc import ABC, abstractmethod
-from urllib.parse import urlparse
 
 import openai
 import pandas as pd
 import yaml
 
-from Util import setup_logger, get_project_root, storage_cached
+from PromptBuilder import PromptBuilder
+from RateLimitScheduler import get_rate_limit_scheduler
+from TokenizerService import get_tokenizer_service
+from Util import setup_logger, get_project_root, storage_cached, single_flight
 from website.sender import Sender, MSG_TYPE_SEARCH_STEP, MSG_TYPE_OPEN_AI_STREAM
 
 logger = setup_logger('LLMService')
@@ -19,6 +21,11 @@ class LLMService(ABC):
     def clean_response_text(self, response_text: str):
         return response_text.replace("\n", "")
 
+    @staticmethod
+    def get_request_token_count(prompt: str, max_tokens: int) -> int:
+        # tokens counted against the rate limit: the prompt and the max completion(요청이 차지하는 토큰 수 추정)
+        return get_tokenizer_service().count_tokens(prompt, is_memoized=False) + (max_tokens or 0)
+
     # 프롬프트를 생성
     def get_prompt(self, search_text: str, gpt_input_text_df: pd.DataFrame):
         logger.info(f"OpenAIService.get_prompt. search_text: {search_text}, gpt_input_text_df.shape: {gpt_input_text_df.shape}")
@@ -78,15 +85,12 @@ Query: {search_text}
             return prompt
 
         logger.info(f"OpenAIService.get_prompt_v3. search_text: {search_text}, gpt_input_text_df.shape: {gpt_input_text_df.shape}")
-        context_str = ""
-        for _, row_url in gpt_input_text_df[['url_id', 'url']].drop_duplicates().iterrows():
-            domain = urlparse(row_url['url']).netloc.replace('www.', '')
-            context_str += f"Source [{row_url['url_id']}] {domain}\n"
-            for index, row in gpt_input_text_df[(gpt_input_text_df['url_id'] == row_url['url_id']) & gpt_input_text_df['in_scope']].iterrows():
-                context_str += f"{row['text']}\n"
-            context_str += "\n\n"
-        prompt_length_limit = self.config.get('llm_service').get('openai_api').get('prompt').get('prompt_length_limit')
-        context_str = context_str[:prompt_length_limit]
+        prompt_token_limit = self.config.get('llm_service').get('openai_api').get('prompt').get('prompt_token_limit')
+        prompt_context = PromptBuilder(prompt_token_limit).build(gpt_input_text_df)
+        gpt_input_text_df['in_scope'] = prompt_context.is_included  # only rows in the prompt can be cited as sources(프롬프트에 들어간 행만 출처로 표시)
+        logger.info(f"OpenAIService.get_prompt_v3. context token used: {prompt_context.used_token}/{prompt_token_limit}, "
+                    f"dropped: {prompt_context.dropped_token} tokens in {prompt_context.number_of_dropped_row} rows")
+        context_str = prompt_context.context_str
         prompt = \
             f"""
 Web search result:
@@ -114,7 +118,9 @@ class OpenAIService(LLMService):
         if open_api_key is None:
             raise Exception("OpenAI API key is not set.")
         openai.api_key = open_api_key
+        self.rate_limit_scheduler = get_rate_limit_scheduler(config, 'openai_chat')
 
+    @single_flight('openai', 'prompt')
     @storage_cached('openai', 'prompt')
     def call_api(self, prompt: str):
         if self.sender is not None:
@@ -124,17 +130,18 @@ class OpenAIService(LLMService):
         model = openai_api_config.get('model')
         is_stream = openai_api_config.get('stream')
         logger.info(f"OpenAIService.call_api. model: {model}, len(prompt): {len(prompt)}")
+        token_count = self.get_request_token_count(prompt, openai_api_config.get('max_tokens'))
 
         if model in ['gpt-3.5-turbo', 'gpt-4']:
             try:
-                response = openai.ChatCompletion.create(
+                response = self.rate_limit_scheduler.run(lambda: openai.ChatCompletion.create(
                     model=model,
                     messages=[
                         {"role": "system", "content": "You are a helpful search engine."},
                         {"role": "user", "content": prompt}
                     ],
                     stream=is_stream
-                )
+                ), token_count=token_count)
             except Exception as ex:
                 raise ex
 
@@ -154,13 +161,13 @@ class OpenAIService(LLMService):
                 return response.choices[0].message.content
         else:
             try:
-                response = openai.Completion.create(
+                response = self.rate_limit_scheduler.run(lambda: openai.Completion.create(
                     model=model,
                     prompt=prompt,
                     max_tokens=openai_api_config.get('max_tokens'),
                     temperature=openai_api_config.get('temperature'),
                     top_p=openai_api_config.get('top_p'),
-                )
+                ), token_count=token_count)
             except Exception as ex:
                 raise ex
             return self.clean_response_text(response.choices[0].text)
@@ -175,7 +182,9 @@ class GooseAIService(LLMService):
             raise Exception("Goose API key is not set.")
         openai.api_key = goose_api_key
         openai.api_base = config.get('goose_ai_api').get('api_base')
+        self.rate_limit_scheduler = get_rate_limit_scheduler(config, 'gooseai')
 
+    @single_flight('gooseai', 'prompt')
     @storage_cached('gooseai', 'prompt')
     def call_api(self, prompt: str, sender: Sender = None):
         if self.sender is not None:
@@ -183,12 +192,12 @@ class GooseAIService(LLMService):
         logger.info(f"GooseAIService.call_openai_api. len(prompt): {len(prompt)}")
         goose_api_config = self.config.get('goose_ai_api')
         try:
-            response = openai.Completion.create(
+            response = self.rate_limit_scheduler.run(lambda: openai.Completion.create(
                 engine=goose_api_config.get('model'),
                 prompt=prompt,
                 max_tokens=goose_api_config.get('max_tokens'),
                 # stream=True
-            )
+            ), token_count=self.get_request_token_count(prompt, goose_api_config.get('max_tokens')))
         except Exception as ex:
             raise ex
         return self.clean_response_text(response.choices[0].text)
@@ -0,0 +1,54 @@
+import re
+
+import numpy as np
+
+from Util import setup_logger
+
+logger = setup_logger('LexicalSearchService')
+
+# Chinese/Japanese characters are not separated by spaces, thus each character is a token
+CJK_CHAR_RANGE = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+TOKEN_PATTERN = re.compile(rf'[{CJK_CHAR_RANGE}]|[^\W{CJK_CHAR_RANGE}]+')
+
+
+def tokenize_for_lexical_search(text: str) -> list:
+    """
+    Lowercased word tokens, CJK characters as single tokens
+    Input: "What is ChatGPT 日本国"
+    Output: ['what', 'is', 'chatgpt', '日', '本', '国']
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Service:
+    """
+    Okapi BM25 in pure Python/NumPy (no JVM like PyTerrier)
+    Only the query terms are counted, so the cost is one pass of tokenization over the texts.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    def get_scores(self, texts, query: str) -> np.ndarray:
+        query_term_list = list(dict.fromkeys(tokenize_for_lexical_search(query)))
+        query_term_index = {term: i for i, term in enumerate(query_term_list)}
+        term_frequency = np.zeros((len(texts), len(query_term_list)), dtype=np.float32)
+        doc_length = np.zeros(len(texts), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize_for_lexical_search(text)
+            doc_length[row] = len(tokens)
+            for token in tokens:
+                column = query_term_index.get(token)
+                if column is not None:
+                    term_frequency[row, column] += 1
+        if len(texts) == 0 or len(query_term_list) == 0:
+            return np.zeros(len(texts), dtype=np.float32)
+
+        number_of_doc = len(texts)
+        doc_frequency = (term_frequency > 0).sum(axis=0)
+        idf = np.log(1 + (number_of_doc - doc_frequency + 0.5) / (doc_frequency + 0.5))
+        avg_doc_length = max(doc_length.mean(), 1)
+        length_norm = self.k1 * (1 - self.b + self.b * doc_length / avg_doc_length)
+        scores = (idf * term_frequency * (self.k1 + 1) / (term_frequency + length_norm[:, None])).sum(axis=1)
+        return scores.astype(np.float32)
@@ -1,4 +1,4 @@
-import tiktoken
+from TokenizerService import DEFAULT_TOKENIZER_MODEL, get_tokenizer_service
 
 
 def remove_substrings(strings):
@@ -84,14 +84,21 @@ def split_with_delimiters(string, delimiter_list):
     return result
 
 
-def num_tokens_from_string(string: str) -> int:
+def num_tokens_from_string(string: str, model: str = DEFAULT_TOKENIZER_MODEL) -> int:
     """
     Returns the number of tokens in a text string.(주어진 문자열의 토큰 수를 반환)
     https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
     """
-    encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
+    return get_tokenizer_service(model).count_tokens(string)
+
+
+def num_tokens_from_strings(strings, model: str = DEFAULT_TOKENIZER_MODEL) -> list:
+    """
+    Batch version of num_tokens_from_string: one encode_batch call for the texts not counted before
+    Input: ['Hello world', 'ChatGPT']
+    Output: [2, 3]
+    """
+    return get_tokenizer_service(model).count_tokens_batch(strings)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,78 @@
+from collections import namedtuple
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+from NLPUtil import num_tokens_from_string, num_tokens_from_strings
+from TokenizerService import get_tokenizer_service
+
+# context_str: web search result part of the prompt, is_included: per row of gpt_input_text_df, True if the row is in context_str
+PromptContext = namedtuple('PromptContext', ['context_str', 'used_token', 'dropped_token', 'number_of_dropped_row', 'is_included'])
+ROW_SEPARATOR_TOKEN = 1  # '\n' after every row
+SOURCE_SEPARATOR_TOKEN = 1  # '\n\n' after every source
+
+
+class PromptBuilder:
+    """
+    Web search result part of the prompt within a token budget
+    - rows are taken in rank order while they fit, a row is never split. A row that does not fit is skipped, thus a shorter row of lower rank may still fill the rest
+    - the header of a source ('Source [url_id] domain') is paid with the first row taken from that source
+    - token counts: len_token of post_process_gpt_input_text_df, headers are counted once per source
+    - layout: sources in url_id order, rows of a source in rank order
+    """
+
+    def __init__(self, token_budget: int):
+        self.token_budget = token_budget
+
+    @staticmethod
+    def get_source_header(url_id, url: str) -> str:
+        domain = urlparse(url).netloc.replace('www.', '')
+        return f"Source [{url_id}] {domain}\n"
+
+    @staticmethod
+    def join_context(header_dict: dict, row_index_dict: dict, text_list: list) -> str:
+        return ''.join(header_dict[url_id] + ''.join(f"{text_list[i]}\n" for i in row_index_dict[url_id]) + "\n\n"
+                       for url_id in sorted(row_index_dict))
+
+    def build(self, gpt_input_text_df: pd.DataFrame) -> PromptContext:
+        """
+        Input: gpt_input_text_df in rank order with columns url_id, url, text, len_token
+        Output: PromptContext(context_str='Source [1] a.com\\nfirst sentence\\n\\n\\n', used_token=9, dropped_token=0, number_of_dropped_row=0, is_included=array([True]))
+        """
+        url_id_list = gpt_input_text_df['url_id'].tolist()
+        url_list = gpt_input_text_df['url'].tolist()
+        text_list = gpt_input_text_df['text'].tolist()
+        if 'len_token' in gpt_input_text_df.columns:
+            len_token_list = gpt_input_text_df['len_token'].tolist()
+        else:
+            len_token_list = num_tokens_from_strings(text_list)
+
+        # one pass in rank order: take a row if it fits, grouped by source on the way(순위 순서로 한 번 순회하며 예산 안의 행을 소스별로 모음)
+        header_dict, header_token_dict, row_index_dict = {}, {}, {}
+        is_included = np.zeros(len(text_list), dtype=bool)
+        used_token = 0
+        for i, (url_id, url, len_token) in enumerate(zip(url_id_list, url_list, len_token_list)):
+            if url_id not in header_dict:
+                header_dict[url_id] = self.get_source_header(url_id, url)
+                header_token_dict[url_id] = num_tokens_from_string(header_dict[url_id]) + SOURCE_SEPARATOR_TOKEN
+            cost = len_token + ROW_SEPARATOR_TOKEN + (header_token_dict[url_id] if url_id not in row_index_dict else 0)
+            if used_token + cost > self.token_budget:
+                continue
+            used_token += cost
+            row_index_dict.setdefault(url_id, []).append(i)
+            is_included[i] = True
+
+        # the tokenizer may merge tokens across row boundaries differently, count the result and drop the lowest ranked rows while over budget
+        context_str = self.join_context(header_dict, row_index_dict, text_list)
+        used_token = get_tokenizer_service().count_tokens(context_str, is_memoized=False) if context_str else 0
+        while used_token > self.token_budget:
+            last_index = int(np.flatnonzero(is_included)[-1])
+            is_included[last_index] = False
+            row_index_dict[url_id_list[last_index]].remove(last_index)
+            row_index_dict = {url_id: index_list for url_id, index_list in row_index_dict.items() if index_list}
+            context_str = self.join_context(header_dict, row_index_dict, text_list)
+            used_token = get_tokenizer_service().count_tokens(context_str, is_memoized=False) if context_str else 0
+
+        dropped_token = int(sum(len_token for len_token, included in zip(len_token_list, is_included) if not included))
+        return PromptContext(context_str, used_token, dropped_token, int((~is_included).sum()), is_included)
@@ -0,0 +1,230 @@
+import contextvars
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import openai
+
+from Util import setup_logger
+
+logger = setup_logger('RateLimitScheduler')
+
+RETRYABLE_ERRORS = (openai.error.RateLimitError, openai.error.APIError, openai.error.Timeout,
+                    openai.error.ServiceUnavailableError, openai.error.APIConnectionError)
+PRIORITY_INTERACTIVE = 0  # a user is waiting for the answer
+PRIORITY_BACKGROUND = 1  # warmers, e.g. the full answer of a snippet-only search
+PRIORITY_NAME_DICT = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BACKGROUND: 'background'}
+DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNIT_SECOND = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+# priority of the provider calls of the current request / background job(현재 작업의 우선순위)
+current_priority = contextvars.ContextVar('rate_limit_priority', default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def rate_limit_priority(priority: int):
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def get_current_priority() -> int:
+    return current_priority.get()
+
+
+def parse_duration_second(duration: str):
+    """
+    Input: '6m0s' / '1.5s' / '20ms' (x-ratelimit-reset-* headers) or '7' (retry-after)
+    Output: 360.0 / 1.5 / 0.02 / 7.0, None if not parsable
+    """
+    try:
+        return float(duration)
+    except (TypeError, ValueError):
+        pass
+    matches = DURATION_PATTERN.findall(duration or '')
+    if not matches:
+        return None
+    return sum(float(value) * DURATION_UNIT_SECOND[unit] for value, unit in matches)
+
+
+class TokenBucket:
+    """per_minute units, refilled continuously. A single request larger than the bucket waits for a full bucket"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate_per_second = per_minute / 60
+        self.level = per_minute
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def get_wait_second(self, amount: float, now: float) -> float:
+        self.refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate_per_second
+
+    def consume(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+    def limit_level(self, remaining: float):
+        # quota reported by the provider is the truth, e.g. other processes share the same key(제공자가 알려준 남은 양으로 맞춤)
+        self.level = min(self.level, remaining)
+
+
+class RateLimitScheduler:
+    """
+    Shared gate of the calls of one provider API
+    - token buckets: requests per minute and tokens per minute, a call starts once both have room
+    - priority queue: waiting calls start in (priority, arrival) order, interactive before background
+    - retries: jittered exponential backoff, retry-after / x-ratelimit-reset-* headers of a 429 are used when given,
+               and a 429 pauses all calls of the provider, not only the failed one
+    - metrics: queue depth, waiting time, retries and rate-limited responses (get_stats)
+    """
+
+    def __init__(self, name: str, requests_per_minute: int, tokens_per_minute: int, max_retries: int, backoff_base: float, max_backoff: float):
+        self.name = name
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.condition = threading.Condition()
+        self.waiting_heap = []  # (priority, arrival number)
+        self.arrival_counter = itertools.count()
+        self.paused_until = 0.0  # monotonic time, set by a 429
+
+        self.number_of_request = 0
+        self.number_of_retry = 0
+        self.number_of_rate_limited = 0
+        self.number_of_failure = 0
+        self.total_wait_second = 0.0
+        self.max_queue_depth = 0
+
+    def acquire(self, token_count: int, priority: int):
+        """Block until it is the turn of this call and both buckets have room, then take from them"""
+        ticket = (priority, next(self.arrival_counter))
+        start_time = time.monotonic()
+        with self.condition:
+            heapq.heappush(self.waiting_heap, ticket)
+            self.max_queue_depth = max(self.max_queue_depth, len(self.waiting_heap))
+            try:
+                while True:
+                    wait_second = None  # not the head of the queue: wait to be notified
+                    if self.waiting_heap[0] == ticket:
+                        now = time.monotonic()
+                        wait_second = max(self.request_bucket.get_wait_second(1, now), self.token_bucket.get_wait_second(token_count, now),
+                                          self.paused_until - now)
+                        if wait_second <= 0:
+                            self.request_bucket.consume(1)
+                            self.token_bucket.consume(token_count)
+                            self.number_of_request += 1
+                            self.total_wait_second += now - start_time
+                            return
+                    self.condition.wait(timeout=wait_second)
+            finally:
+                self.waiting_heap.remove(ticket)
+                heapq.heapify(self.waiting_heap)
+                self.condition.notify_all()
+
+    def get_retry_wait_second(self, ex: Exception, attempt: int) -> float:
+        headers = {key.lower(): value for key, value in (getattr(ex, 'headers', None) or {}).items()}
+        wait_second = parse_duration_second(headers.get('retry-after'))
+        if wait_second is None and isinstance(ex, openai.error.RateLimitError):
+            reset_second_list = [parse_duration_second(headers.get(key)) for key in ['x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens']]
+            reset_second_list = [reset_second for reset_second in reset_second_list if reset_second is not None]
+            wait_second = max(reset_second_list) if reset_second_list else None
+        if wait_second is None:
+            wait_second = self.backoff_base * (2 ** attempt)
+        return min(self.max_backoff, wait_second + random.uniform(0, self.backoff_base))  # jitter: retries of many calls do not fire together
+
+    def sync_with_headers(self, ex: Exception):
+        headers = {key.lower(): value for key, value in (getattr(ex, 'headers', None) or {}).items()}
+        with self.condition:
+            now = time.monotonic()
+            for bucket, key in [(self.request_bucket, 'x-ratelimit-remaining-requests'), (self.token_bucket, 'x-ratelimit-remaining-tokens')]:
+                remaining = parse_duration_second(headers.get(key))
+                if remaining is not None:
+                    bucket.refill(now)
+                    bucket.limit_level(remaining)
+
+    def run(self, func, token_count: int = 0, priority: int = None):
+        """
+        Call func (one provider request) when the rate limit allows, retry retryable errors
+        token_count: estimated tokens of the request (prompt + max completion)
+        priority: default is the priority of the current context (rate_limit_priority)
+        """
+        priority = get_current_priority() if priority is None else priority
+        for attempt in range(self.max_retries + 1):
+            self.acquire(token_count, priority)
+            try:
+                return func()
+            except RETRYABLE_ERRORS as ex:
+                is_quota_exhausted = getattr(ex, 'code', None) == 'insufficient_quota'  # billing, not a rate: retry cannot help
+                if attempt == self.max_retries or is_quota_exhausted:
+                    with self.condition:
+                        self.number_of_failure += 1
+                    raise ex
+                wait_second = self.get_retry_wait_second(ex, attempt)
+                with self.condition:
+                    self.number_of_retry += 1
+                    if isinstance(ex, openai.error.RateLimitError):
+                        self.number_of_rate_limited += 1
+                        self.paused_until = max(self.paused_until, time.monotonic() + wait_second)
+                        self.condition.notify_all()
+                logger.warning(f"RateLimitScheduler.run. {self.name} retry {attempt + 1}/{self.max_retries} in {wait_second:.1f}s: {type(ex).__name__}: {ex}")
+                if isinstance(ex, openai.error.RateLimitError):
+                    self.sync_with_headers(ex)  # the pause is applied by acquire
+                else:
+                    time.sleep(wait_second)
+
+    def get_stats(self) -> dict:
+        with self.condition:
+            now = time.monotonic()
+            self.request_bucket.refill(now)
+            self.token_bucket.refill(now)
+            queue_depth_by_priority = {priority_name: 0 for priority_name in PRIORITY_NAME_DICT.values()}
+            for priority, _ in self.waiting_heap:
+                priority_name = PRIORITY_NAME_DICT.get(priority, str(priority))
+                queue_depth_by_priority[priority_name] = queue_depth_by_priority.get(priority_name, 0) + 1
+            return {'queue_depth': len(self.waiting_heap),
+                    'queue_depth_by_priority': queue_depth_by_priority,
+                    'max_queue_depth': self.max_queue_depth,
+                    'number_of_request': self.number_of_request,
+                    'number_of_retry': self.number_of_retry,
+                    'number_of_rate_limited': self.number_of_rate_limited,
+                    'number_of_failure': self.number_of_failure,
+                    'average_wait_second': self.total_wait_second / self.number_of_request if self.number_of_request > 0 else 0.0,
+                    'remaining_requests': int(self.request_bucket.level),
+                    'remaining_tokens': int(self.token_bucket.level),
+                    'paused_second': max(0.0, self.paused_until - now)}
+
+
+# one scheduler per provider API per process, shared by all requests(프로세스 당 제공자 API별 스케줄러 하나를 공유)
+rate_limit_scheduler_dict = {}
+rate_limit_scheduler_dict_lock = threading.Lock()
+
+
+def get_rate_limit_scheduler(config, name: str) -> RateLimitScheduler:
+    """name: key of rate_limit.limits in config.yaml, e.g. openai_chat / openai_embedding / gooseai"""
+    rate_limit_config = config.get('rate_limit')
+    with rate_limit_scheduler_dict_lock:
+        if name not in rate_limit_scheduler_dict:
+            limit_config = rate_limit_config.get('limits').get(name)
+            rate_limit_scheduler_dict[name] = RateLimitScheduler(name, limit_config.get('requests_per_minute'), limit_config.get('tokens_per_minute'),
+                                                                 rate_limit_config.get('max_retries'), rate_limit_config.get('backoff_base'),
+                                                                 rate_limit_config.get('max_backoff'))
+        return rate_limit_scheduler_dict[name]
+
+
+def get_rate_limit_stats() -> dict:
+    with rate_limit_scheduler_dict_lock:
+        scheduler_list = list(rate_limit_scheduler_dict.values())
+    return {scheduler.name: scheduler.get_stats() for scheduler in scheduler_list}
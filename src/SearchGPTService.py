@@ -1,17 +1,29 @@
+import concurrent.futures
+import contextvars
 import os
+import threading
+from pathlib import Path
 
-import pandas as pd
 import yaml
 
+from AnswerCache import get_answer_cache
+from DedupService import DedupService
 from FrontendService import FrontendService
 from LLMService import LLMServiceFactory
-from SemanticSearchService import BatchOpenAISemanticSearchService
+from RateLimitScheduler import rate_limit_priority, PRIORITY_BACKGROUND
+from SemanticSearchService import SemanticSearchServiceFactory
 from SourceService import SourceService
-from Util import setup_logger, get_project_root, storage_cached
-from website.sender import Sender
+from TextDfUtil import concat_text_df
+from Util import setup_logger, get_project_root, storage_cached, check_result_cache_exists, path_safe_string_conversion
+from website.sender import Sender, MSG_TYPE_SEARCH_STEP
 
 logger = setup_logger('SearchGPTService')
 
+# full answers of snippet-only searches computed in the background, one per search text at a time(스니펫 답변 이후 전체 답변을 백그라운드에서 계산)
+upgrade_executor = None
+upgrade_search_text_set = set()
+upgrade_lock = threading.Lock()
+
 
 class SearchGPTService:
     """
@@ -22,7 +34,9 @@ class SearchGPTService:
     - SourceService
     -- BingService
     -- Doc/PPT/PDF Service
-    - SemanticSearchModule
+    - SemanticSearchService
+    -- BatchOpenAISemanticSearchService
+    -- HashingSemanticSearchService
     - LLMService
     -- OpenAIService
     -- GooseAPIService
@@ -33,6 +47,7 @@ class SearchGPTService:
     def __init__(self, ui_overriden_config=None, sender: Sender = None):
         with open(os.path.join(get_project_root(), 'src/config/config.yaml'), encoding='utf-8') as f:
             self.config = yaml.load(f, Loader=yaml.FullLoader)
+        self.ui_overriden_config = ui_overriden_config
         self.overide_config_by_query_string(ui_overriden_config)
         self.validate_config()
         self.sender = sender
@@ -53,6 +68,8 @@ class SearchGPTService:
                     self.config['llm_service']['openai_api']['api_key'] = value
                 elif key == 'is_use_source':
                     self.config['source_service']['is_use_source'] = False if value.lower() in ['false', '0'] else True
+                elif key == 'is_snippet_only':
+                    self.config['source_service']['snippet_only']['is_enable'] = False if value.lower() in ['false', '0'] else True
                 elif key == 'llm_service_provider':
                     self.config['llm_service']['provider'] = value
                 elif key == 'llm_model':
@@ -77,16 +94,25 @@ class SearchGPTService:
 
     # 검색 질의를 수행하고 답변을 가져옴
     @storage_cached('web', 'search_text')
-    def query_and_get_answer(self, search_text):
+    def query_and_get_answer(self, search_text, query_embedding=None):
+        """query_embedding: given by the snippet-only tier, which already looked up the answer cache for search_text"""
         source_module = SourceService(self.config, self.sender) # SourceService 객체 생성
-        bing_text_df = source_module.extract_bing_text_df(search_text) # Bing에서 텍스트 데이터 프레임을 추출
-        doc_text_df = source_module.extract_doc_text_df(bing_text_df) # 문서에서 텍스트 데이터 프레임을 추출
-        text_df = pd.concat([bing_text_df, doc_text_df], ignore_index=True) # Bing과 문서에서 추출한 텍스트 데이터 프레임을 합친다.
+        semantic_search_service = SemanticSearchServiceFactory.create_semantic_search_service(self.config, self.sender) # SemanticSearchService 객체를 생성
+        if query_embedding is None:
+            answer, query_embedding = self.get_answer_of_similar_search(semantic_search_service, search_text) # 비슷한 이전 검색의 답변이 있으면 재사용
+            if answer is not None:
+                return answer
+        if self.config['semantic_search']['prefetch']['is_enable']:
+            bing_text_df = self.extract_bing_text_df_with_prefetch(source_module, semantic_search_service, search_text) # 웹사이트별로 도착하는 대로 임베딩 시작
+        else:
+            bing_text_df = source_module.extract_bing_text_df(search_text) # Bing에서 텍스트 데이터 프레임을 추출
+        doc_text_df = source_module.extract_doc_text_df(bing_text_df, search_text) # 문서에서 텍스트 데이터 프레임을 추출
+        text_df = concat_text_df([bing_text_df, doc_text_df]) # Bing과 문서에서 추출한 텍스트 데이터 프레임을 합친다. (카테고리 컬럼은 복사하지 않음)
+        text_df = DedupService(self.config).dedup_text_df(text_df) # 중복/유사 중복 문장을 제거
 
-        semantic_search_service = BatchOpenAISemanticSearchService(self.config, self.sender) # BatchOpenAISemanticSearchService 객체를 생성
         gpt_input_text_df = semantic_search_service.search_related_source(text_df, search_text) # 관련 소스를 검색하고 GPT 입력 텍스트 데이터 프레임을 가져옴
-        gpt_input_text_df = BatchOpenAISemanticSearchService.post_process_gpt_input_text_df(gpt_input_text_df,
-                                                                                            self.config.get('llm_service').get('openai_api').get('prompt').get('prompt_token_limit')) # GPT 입력 텍스트 데이터 프레임을 후처리
+        gpt_input_text_df = semantic_search_service.post_process_gpt_input_text_df(gpt_input_text_df,
+                                                                                   self.config.get('llm_service').get('openai_api').get('prompt').get('prompt_token_limit')) # GPT 입력 텍스트 데이터 프레임을 후처리
 
         llm_service = LLMServiceFactory.create_llm_service(self.config, self.sender) # LLMService 객체를 생성
         prompt = llm_service.get_prompt_v3(search_text, gpt_input_text_df) # 검색 질의에 대한 프롬프트를 생성
@@ -104,4 +130,118 @@ class SearchGPTService:
         print('===========Source text:============')
         print(source_text)
 
+        if query_embedding is not None:
+            get_answer_cache(self.config).put(self.get_answer_cache_partition_key(semantic_search_service), search_text, query_embedding,
+                                              (response_text, source_text, data_json))
+        return response_text, source_text, data_json
+
+    # 답변을 공유할 수 있는 검색 조건 (임베딩 모델, 언어, LLM, 소스)
+    def get_answer_cache_partition_key(self, semantic_search_service) -> tuple:
+        source_service_config = self.config['source_service']
+        llm_provider = self.config['llm_service']['provider']
+        llm_model = self.config['llm_service']['openai_api' if llm_provider == 'openai' else 'goose_ai_api']['model']
+        return (semantic_search_service.embedding_model, self.config['general']['language'], llm_provider, llm_model,
+                source_service_config['is_use_source'], source_service_config['is_enable_bing_search'], source_service_config['is_enable_doc_search'])
+
+    # 답변 캐시에서 검색어 임베딩과 충분히 비슷한 이전 검색의 답변 조회
+    def get_answer_of_similar_search(self, semantic_search_service, search_text):
+        """
+        :return: (answer or None, query embedding to store the new answer with, None if the answer cache is disabled)
+        """
+        if not self.config['cache']['is_enable']['answer']:
+            return None, None
+        query_embedding = semantic_search_service.get_embedding_matrix([search_text])[0]
+        answer, similarity, matched_search_text = get_answer_cache(self.config).get(self.get_answer_cache_partition_key(semantic_search_service),
+                                                                                    search_text, query_embedding)
+        if answer is not None and self.sender is not None:
+            self.sender.send_message(msg_type=MSG_TYPE_SEARCH_STEP, msg=f"Reusing the answer of a similar search: {matched_search_text} (similarity {similarity:.3f})")
+        return answer, query_embedding
+
+    # 스니펫만으로 빠르게 답변 (웹페이지 호출, 문장 임베딩 없음). 전체 답변이 이미 웹 캐시에 있으면 그것을 반환
+    def query_and_get_snippet_answer(self, search_text):
+        source_service_config = self.config['source_service']
+        if self.is_answer_cached(search_text) or not source_service_config['is_use_source'] or not source_service_config['is_enable_bing_search']:
+            return self.query_and_get_answer(search_text=search_text)
+        semantic_search_service = SemanticSearchServiceFactory.create_semantic_search_service(self.config, self.sender)
+        source_module = SourceService(self.config, self.sender)
+        # the answer cache lookup (one query embedding) runs while Bing is called, thus it adds no latency(Bing 호출과 동시에 답변 캐시 조회)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            similar_search_future = executor.submit(contextvars.copy_context().run, self.get_answer_of_similar_search_or_none,
+                                                    semantic_search_service, search_text)
+            snippet_text_df = source_module.extract_bing_snippet_text_df(search_text)
+            answer, query_embedding = similar_search_future.result()
+        if answer is not None:
+            return answer # 비슷한 검색의 전체 답변이 있으면 그것을 반환
+
+        # search result order is the relevance order(검색 결과 순서를 관련도 순서로 사용)
+        snippet_text_df['rank'] = range(len(snippet_text_df))
+        snippet_text_df['docno'] = snippet_text_df.index + 1
+        gpt_input_text_df = semantic_search_service.post_process_gpt_input_text_df(snippet_text_df,
+                                                                                   self.config.get('llm_service').get('openai_api').get('prompt').get('prompt_token_limit'))
+
+        llm_service = LLMServiceFactory.create_llm_service(self.config, self.sender)
+        prompt = llm_service.get_prompt_v3(search_text, gpt_input_text_df)
+        response_text = llm_service.call_api(prompt=prompt)
+
+        frontend_service = FrontendService(self.config, response_text, gpt_input_text_df)
+        source_text, data_json = frontend_service.get_data_json(response_text, gpt_input_text_df)
+
+        if self.config['source_service']['snippet_only']['is_upgrade_in_background']:
+            self.upgrade_answer_in_background(search_text, query_embedding)
         return response_text, source_text, data_json
+
+    def get_answer_of_similar_search_or_none(self, semantic_search_service, search_text):
+        # the fast tier does not fail because of the answer cache, e.g. the embedding provider is down
+        try:
+            return self.get_answer_of_similar_search(semantic_search_service, search_text)
+        except Exception as ex:
+            logger.warning(f"SearchGPTService.get_answer_of_similar_search_or_none. answer cache lookup failed: {type(ex).__name__}: {ex}")
+            return None, None
+
+    def is_answer_cached(self, search_text) -> bool:
+        """True if query_and_get_answer of search_text would be served from the web cache"""
+        if not self.config.get('cache').get('is_enable').get('web'):
+            return False
+        cache_path = Path(get_project_root(), self.config.get('cache').get('path'))
+        return check_result_cache_exists(cache_path, path_safe_string_conversion(search_text), 'web')
+
+    # 전체 답변을 백그라운드에서 계산하여 웹 캐시에 저장 (다음 같은 검색은 전체 답변을 받음)
+    def upgrade_answer_in_background(self, search_text, query_embedding=None):
+        """query_embedding: of the answer cache lookup already done for search_text, the upgrade does not look up (and count) it again"""
+        global upgrade_executor
+        if not self.config.get('cache').get('is_enable').get('web'):
+            return  # nowhere to keep the full answer
+        with upgrade_lock:
+            if search_text in upgrade_search_text_set:
+                return
+            upgrade_search_text_set.add(search_text)
+            if upgrade_executor is None:
+                upgrade_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.config['source_service']['snippet_only']['upgrade_max_workers'],
+                                                                         thread_name_prefix='SearchGPTService.upgrade')
+
+        def upgrade():
+            try:
+                full_answer_service = SearchGPTService(dict(self.ui_overriden_config or {}, is_snippet_only='false'))
+                with rate_limit_priority(PRIORITY_BACKGROUND):  # searches of waiting users go first
+                    full_answer_service.query_and_get_answer(search_text=search_text, query_embedding=query_embedding)
+                logger.info(f"SearchGPTService.upgrade_answer_in_background. full answer cached: {search_text}")
+            except Exception as ex:
+                logger.error(f"SearchGPTService.upgrade_answer_in_background. failed: {search_text}, {type(ex).__name__}: {ex}")
+            finally:
+                with upgrade_lock:
+                    upgrade_search_text_set.discard(search_text)
+
+        upgrade_executor.submit(upgrade)
+
+    # 웹사이트별 문장이 도착하는 대로 임베딩을 미리 계산 (가장 느린 사이트를 기다리지 않음)
+    @staticmethod
+    def extract_bing_text_df_with_prefetch(source_module: SourceService, semantic_search_service, search_text):
+        if source_module.config['source_service']['is_use_source']:
+            semantic_search_service.prefetch_embeddings([search_text])
+        bing_text_df_list = []
+        for website_text_df in source_module.iter_bing_text_df(search_text):
+            semantic_search_service.prefetch_text_df_embeddings(website_text_df, search_text)
+            bing_text_df_list.append(website_text_df)
+        if not bing_text_df_list:
+            return None
+        return concat_text_df(bing_text_df_list).sort_values('url_id', kind='stable').reset_index(drop=True)  # back to url_id order
@@ -1,50 +1,300 @@
+import concurrent.futures
+import contextvars
+import math
+import re
+from abc import ABC, abstractmethod
+
+import numpy as np
 import openai
 import pandas as pd
-import re
-from openai.embeddings_utils import cosine_similarity
 from website.sender import Sender, MSG_TYPE_SEARCH_STEP
 
+from DedupService import NearDuplicateFilter
+from EmbeddingBatchScheduler import EmbeddingBatchScheduler
+from EmbeddingCache import get_embedding_cache
+from EmbeddingQuantizer import QuantizedEmbeddingMatrix
+from LexicalSearchService import BM25Service
+from RateLimitScheduler import get_rate_limit_scheduler
 from Util import setup_logger
-from NLPUtil import num_tokens_from_string
+from NLPUtil import num_tokens_from_strings
 
-# from abc import ABC, abstractmethod
 # from langchain.embeddings import HuggingFaceEmbeddings
 # from langchain.vectorstores import FAISS
 BASE_MODEL = "text-embedding-ada-002"  # default embedding of faiss-openai
 logger = setup_logger('SemanticSearchService')
 
 
-# class SemanticSearchService(ABC):
-#     def __init__(self, config):
-#         self.cwd = os.getcwd()
-#         self.config = config
-#         self.index = None
-#         self.provider = ''
-#
-#     @abstractmethod
-#     def index_text_df(self, text_df: pd.DataFrame, indexref_folder_name: str):
-#         pass
-#
-#     @abstractmethod
-#     def retrieve_result_by_search_text_from_text_df(self, search_text, text_df) -> pd.DataFrame:
-#         pass
-#
-#     @staticmethod
-#     def use_index_to_search(index, search_text):
-#         pass
-#
-#     def clean_sentence_to_avoid_lexical_error(self, text):
-#         """
-#         Clean sentence. Pyterrier will throw error if the search query contains some special characters shown below
-#             jnius.JavaException: JVM exception occurred: Failed to process qid 1 '
-#             <search query>' -- Lexical error at line 3, column 90.  Encountered: "\'" (39), after : "" org.terrier.querying.parser.QueryParserException
-#             python-BaseException
-#         :return:
-#         """
-#         # TODO: good way to clean
-#         return text.replace("'", "").replace("?", "").replace("!", "").replace(":", "").replace(";", "")
-#
-#
+def normalize_embedding_matrix(embedding_matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row in place so that cosine similarity becomes a plain dot product"""
+    norms = np.linalg.norm(embedding_matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    embedding_matrix /= norms
+    return embedding_matrix
+
+
+def get_top_n_index(scores: np.ndarray, n: int) -> np.ndarray:
+    """
+    Index of the n largest scores in descending order, using argpartition instead of a full sort
+    Input: [0.1, 0.9, 0.5, 0.7], n=2
+    Output: [1, 3]
+    """
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.array([], dtype=np.int64)
+    top_n_index = np.argpartition(-scores, n - 1)[:n]
+    return top_n_index[np.argsort(-scores[top_n_index], kind='stable')]
+
+
+def get_rank(scores: np.ndarray) -> np.ndarray:
+    """
+    1-based rank of each score, highest first
+    Input: [0.1, 0.9, 0.5]
+    Output: [3, 1, 2]
+    """
+    rank = np.empty(len(scores), dtype=np.int64)
+    rank[np.argsort(-scores, kind='stable')] = np.arange(1, len(scores) + 1)
+    return rank
+
+
+def get_reciprocal_rank_fusion_scores(dense_scores: np.ndarray, lexical_scores: np.ndarray, rrf_k: int = 60) -> np.ndarray:
+    """
+    Reciprocal rank fusion: sum of 1 / (rrf_k + rank) over the dense and the lexical ranking
+    Rows without any query term (lexical score 0) get no lexical contribution.
+    """
+    rrf_scores = 1 / (rrf_k + get_rank(dense_scores))
+    rrf_scores += np.where(lexical_scores > 0, 1 / (rrf_k + get_rank(lexical_scores)), 0)
+    return rrf_scores.astype(np.float32)
+
+
+def get_mmr_index(embedding_matrix: np.ndarray, relevance: np.ndarray, n: int, lambda_mult: float) -> np.ndarray:
+    """
+    Maximal marginal relevance selection in O(n * len(relevance)) vector operations
+    Each step picks argmax(lambda * relevance - (1 - lambda) * max similarity to the already selected rows),
+    the max similarity is updated incrementally with one matrix-vector product per step.
+    :return: index of the n selected rows of embedding_matrix, in selection order
+    """
+    n = min(n, len(relevance))
+    selected_index_list = []
+    is_selected = np.zeros(len(relevance), dtype=bool)
+    max_similarity_to_selected = np.zeros(len(relevance), dtype=np.float32)
+    for _ in range(n):
+        mmr_scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity_to_selected
+        mmr_scores[is_selected] = -np.inf
+        best_index = int(np.argmax(mmr_scores))
+        selected_index_list.append(best_index)
+        is_selected[best_index] = True
+        similarity_to_best = embedding_matrix @ embedding_matrix[best_index]
+        max_similarity_to_selected = similarity_to_best if len(selected_index_list) == 1 else np.maximum(max_similarity_to_selected, similarity_to_best)
+    return np.array(selected_index_list, dtype=np.int64)
+
+
+class SemanticSearchService(ABC):
+    def __init__(self, config, sender: Sender = None):
+        self.config = config
+        self.sender = sender
+        self.provider = ''
+        self.embedding_model = ''
+        self.embedding_cache = None
+        # embeddings computed while the source stage is still running, text -> embedding(소스 추출 중 미리 계산한 임베딩)
+        self.prefetched_embedding_dict = {}
+        self.prefetch_executor = None
+        self.prefetch_future_list = []
+        self.prefetch_dedup_filter = None  # sentences prefetched so far in this search, by SimHash
+
+    @abstractmethod
+    def batch_call_embeddings(self, texts) -> list:
+        pass
+
+    # 미리 계산된 임베딩을 먼저 사용하고, 나머지만 캐시/임베딩 제공자에서 가져옴
+    def get_embeddings(self, texts):
+        """Get embeddings of texts in order. Texts embedded by prefetch_embeddings are not embedded again."""
+        embeddings = [self.prefetched_embedding_dict.get(text) for text in texts]
+        miss_index_list = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if len(miss_index_list) == len(texts):
+            return self.get_embeddings_from_cache_or_provider(texts)
+        logger.info(f"get_embeddings() len(texts): {len(texts)}, prefetched: {len(texts) - len(miss_index_list)}")
+        if miss_index_list:
+            miss_embeddings = self.get_embeddings_from_cache_or_provider([texts[i] for i in miss_index_list])
+            for i, embedding in zip(miss_index_list, miss_embeddings):
+                embeddings[i] = embedding
+        return embeddings
+
+    # 캐시에 없는 텍스트만 임베딩하고, 캐시 결과와 원래 순서대로 합쳐서 반환
+    def get_embeddings_from_cache_or_provider(self, texts):
+        """Get embeddings of texts in order. Only cache misses are sent to the embedding provider."""
+        if self.embedding_cache is None:
+            return self.batch_call_embeddings(texts)
+
+        embeddings = self.embedding_cache.get_many(self.embedding_model, texts)
+        miss_index_list = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if miss_index_list:
+            miss_text_list = list(dict.fromkeys(texts[i] for i in miss_index_list))
+            miss_embeddings = self.batch_call_embeddings(miss_text_list)
+            self.embedding_cache.put_many(self.embedding_model, miss_text_list, miss_embeddings)
+            miss_embedding_dict = dict(zip(miss_text_list, miss_embeddings))
+            for i in miss_index_list:
+                embeddings[i] = miss_embedding_dict[texts[i]]
+        logger.info(f"get_embeddings() len(texts): {len(texts)}, cache hit: {len(texts) - len(miss_index_list)}, cache miss: {len(miss_index_list)}")
+        return embeddings
+
+    # 임베딩을 정규화된 float32 행렬로 반환 (행 i = texts[i])
+    def get_embedding_matrix(self, texts) -> np.ndarray:
+        """Embeddings of texts as a contiguous, L2-normalized float32 matrix of shape (len(texts), dim)"""
+        if len(texts) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        embedding_matrix = np.array(self.get_embeddings(texts), dtype=np.float32)
+        return normalize_embedding_matrix(embedding_matrix)
+
+    # 소스 추출이 끝나기 전에 도착한 문장들의 임베딩을 백그라운드에서 미리 계산
+    def prefetch_embeddings(self, texts):
+        """Start embedding texts in the background, search_related_source waits for them and reuses the result"""
+        texts = list(dict.fromkeys(text.replace("\n", " ") for text in texts))
+        if not texts:
+            return
+        if self.prefetch_executor is None:
+            max_workers = self.config.get('semantic_search').get('prefetch').get('max_workers')
+            self.prefetch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+        def embed_and_store(batch_texts):
+            self.prefetched_embedding_dict.update(zip(batch_texts, self.get_embeddings_from_cache_or_provider(batch_texts)))
+
+        # copy_context: the prefetch keeps the rate limit priority of the search(검색의 우선순위를 유지)
+        self.prefetch_future_list.append(self.prefetch_executor.submit(contextvars.copy_context().run, embed_and_store, texts))
+
+    def prefetch_text_df_embeddings(self, text_df: pd.DataFrame, target_text):
+        """
+        prefetch_embeddings for the sentences of one source batch, bounded to keep the embedding volume of the search
+        - only the batch's top (top_k_fraction * bm25_prefilter.top_k) sentences by BM25 are embedded
+        - near-duplicates of sentences prefetched from earlier batches are skipped (DedupService drops them anyway)
+        Sentences picked later by the global prefilter but not prefetched are embedded on demand.
+        """
+        semantic_search_config = self.config.get('semantic_search')
+        texts = text_df['text'].tolist() if len(text_df) > 0 else []
+        if semantic_search_config.get('dedup').get('is_enable'):
+            if self.prefetch_dedup_filter is None:
+                self.prefetch_dedup_filter = NearDuplicateFilter(semantic_search_config.get('dedup').get('hamming_threshold'))
+            texts = self.prefetch_dedup_filter.filter(texts)
+        bm25_prefilter_config = semantic_search_config.get('bm25_prefilter')
+        if bm25_prefilter_config.get('is_enable'):
+            top_k = max(1, math.ceil(bm25_prefilter_config.get('top_k') * semantic_search_config.get('prefetch').get('top_k_fraction')))
+            if len(texts) > top_k:
+                bm25_scores = BM25Service().get_scores(texts, target_text)
+                texts = [texts[i] for i in get_top_n_index(bm25_scores, top_k)]
+        self.prefetch_embeddings(texts)
+
+    def wait_for_prefetch(self):
+        # a failed prefetch is not fatal, the texts are embedded again on demand
+        for future in concurrent.futures.as_completed(self.prefetch_future_list):
+            if future.exception() is not None:
+                logger.warning(f"wait_for_prefetch() prefetch failed: {future.exception()}")
+        self.prefetch_future_list = []
+        self.prefetch_dedup_filter = None
+        if self.prefetch_executor is not None:
+            self.prefetch_executor.shutdown(wait=False)
+            self.prefetch_executor = None
+
+    # 데이터프레임의 텍스트에 대한 임베딩 행렬을 계산하여 데이터프레임과 함께 반환
+    def compute_embeddings_for_text_df(self, text_df: pd.DataFrame):
+        """
+        Compute embeddings for a text_df and return (text_df, embedding_matrix). Row i of the matrix is row i of text_df.
+        embedding_matrix is a normalized QuantizedEmbeddingMatrix in semantic_search.embedding_dtype.
+        """
+        print(f'compute_embeddings_for_text_df() len(texts): {len(text_df)}')
+        text_df['text'] = text_df['text'].apply(lambda x: x.replace("\n", " "))
+        embeddings = self.get_embeddings(text_df['text'].tolist())
+        embedding_dtype = self.config.get('semantic_search').get('embedding_dtype')
+        embedding_matrix = QuantizedEmbeddingMatrix.from_rows(embeddings, len(embeddings[0]) if embeddings else 0, embedding_dtype)
+        return text_df, embedding_matrix
+
+    # BM25 점수 상위 K개 문장만 남겨서 임베딩할 문장 수를 줄임
+    def lexical_prefilter(self, text_df: pd.DataFrame, bm25_scores: np.ndarray):
+        """Keep only the top K rows of text_df by BM25 score, in their original order. Return (text_df, bm25_scores) of the kept rows."""
+        top_k = self.config.get('semantic_search').get('bm25_prefilter').get('top_k')
+        top_k_index = np.sort(get_top_n_index(bm25_scores, top_k))
+        logger.info(f"lexical_prefilter() len(text_df): {len(text_df)} -> {len(top_k_index)}")
+        return text_df.iloc[top_k_index].reset_index(drop=True), bm25_scores[top_k_index]
+
+    # 상위 n개 선택. MMR 사용 시, 유사도 상위 fetch_k개 후보 중에서 다양성을 고려하여 선택
+    def select_top_n_index(self, embedding_matrix: QuantizedEmbeddingMatrix, relevance: np.ndarray, n: int) -> np.ndarray:
+        mmr_config = self.config.get('semantic_search').get('mmr')
+        if not mmr_config.get('is_enable'):
+            return get_top_n_index(relevance, n)
+        candidate_index = get_top_n_index(relevance, mmr_config.get('fetch_k'))
+        mmr_index = get_mmr_index(embedding_matrix.take(candidate_index).to_float32(), relevance[candidate_index], n, mmr_config.get('lambda'))
+        return candidate_index[mmr_index]
+
+    # 관련 소스를 검색하여 결과 데이터프레임을 반환
+    def search_related_source(self, text_df: pd.DataFrame, target_text, n=30):
+        if not self.config.get('source_service').get('is_use_source'):
+            col = ['name', 'url', 'url_id', 'snippet', 'text', 'similarities', 'rank', 'docno']
+            return pd.DataFrame(columns=col)
+
+        if self.sender is not None:
+            self.sender.send_message(msg_type=MSG_TYPE_SEARCH_STEP, msg="Searching from extracted text")
+        print(f'search_similar() text: {target_text}')
+        self.wait_for_prefetch()
+        text_df = text_df.reset_index(drop=True)
+        semantic_search_config = self.config.get('semantic_search')
+        is_hybrid = semantic_search_config.get('retrieval_mode') == 'hybrid'
+        bm25_prefilter_config = semantic_search_config.get('bm25_prefilter')
+        is_prefilter = bm25_prefilter_config.get('is_enable') and len(text_df) > bm25_prefilter_config.get('top_k')
+        bm25_scores = None
+        if is_hybrid or is_prefilter:
+            bm25_scores = BM25Service().get_scores(text_df['text'].tolist(), target_text)
+        if is_prefilter:
+            text_df, bm25_scores = self.lexical_prefilter(text_df, bm25_scores)
+
+        if len(text_df) > 0:
+            query_embedding = self.get_embedding_matrix([target_text])[0]
+            text_df, embedding_matrix = self.compute_embeddings_for_text_df(text_df)
+            similarities = embedding_matrix.dot(query_embedding)
+        else:
+            embedding_matrix = QuantizedEmbeddingMatrix.empty(0, semantic_search_config.get('embedding_dtype'))
+            similarities = np.zeros(0, dtype=np.float32)
+
+        # hybrid: 어휘(BM25) 순위와 임베딩 순위를 RRF로 합침
+        relevance = similarities
+        if is_hybrid and len(text_df) > 0:
+            rrf_scores = get_reciprocal_rank_fusion_scores(similarities, bm25_scores, semantic_search_config.get('rrf_k'))
+            relevance = rrf_scores / rrf_scores.max()  # scale to [0, 1] to be comparable with similarity in MMR
+        top_n_index = self.select_top_n_index(embedding_matrix, relevance, n)
+        result_df = text_df.iloc[top_n_index].copy()
+        result_df['similarities'] = similarities[top_n_index]
+        if is_hybrid:
+            result_df['bm25_score'] = bm25_scores[top_n_index]
+            result_df['rrf_score'] = rrf_scores[top_n_index]
+        result_df['rank'] = range(1, len(result_df) + 1)
+        result_df['docno'] = range(1, len(result_df) + 1)
+        return result_df
+
+    # GPT 입력 데이터프레임을 후처리하여 반환
+    @staticmethod
+    def post_process_gpt_input_text_df(gpt_input_text_df, prompt_token_limit):
+        # clean out of prompt texts for existing [1], [2], [3]... in the source_text for response output stability([1], [2], [3]... 제거)
+        gpt_input_text_df['text'] = gpt_input_text_df['text'].apply(lambda x: re.sub(r'\[[0-9]+\]', '', x))
+        # length of char and token( 문자열 길이, 토큰 계산)
+        gpt_input_text_df['len_text'] = gpt_input_text_df['text'].apply(lambda x: len(x))
+        gpt_input_text_df['len_token'] = num_tokens_from_strings(gpt_input_text_df['text'].tolist())
+
+        # 누적 문자열 길이와 개수
+        gpt_input_text_df['cumsum_len_text'] = gpt_input_text_df['len_text'].cumsum()
+        gpt_input_text_df['cumsum_len_token'] = gpt_input_text_df['len_token'].cumsum()
+
+        max_rank = gpt_input_text_df[gpt_input_text_df['cumsum_len_token'] <= prompt_token_limit]['rank'].max() + 1
+        gpt_input_text_df['in_scope'] = gpt_input_text_df['rank'] <= max_rank  # In order to get also the row slightly larger than prompt_length_limit
+        # reorder url_id with url that in scope. Sources only known as duplicates (DedupService) are numbered after them(중복으로만 남은 출처는 뒤에 번호 부여)
+        url_id_list = list(gpt_input_text_df['url_id'].unique())
+        if 'dup_url_ids' in gpt_input_text_df.columns:
+            primary_url_id_set = set(url_id_list)
+            url_id_list += [url_id for url_id in dict.fromkeys(url_id for dup_url_ids in gpt_input_text_df['dup_url_ids'] for url_id in dup_url_ids)
+                            if url_id not in primary_url_id_set]
+        url_id_map = dict(zip(url_id_list, range(1, len(url_id_list) + 1)))
+        gpt_input_text_df['url_id'] = gpt_input_text_df['url_id'].map(url_id_map)
+        if 'dup_url_ids' in gpt_input_text_df.columns:
+            gpt_input_text_df['dup_url_ids'] = gpt_input_text_df['dup_url_ids'].apply(lambda x: [url_id_map[url_id] for url_id in x])
+        return gpt_input_text_df
+
+
 # class PyTerrierService(SemanticSearchService):
 #     def __init__(self, config):
 #         super().__init__(config)
@@ -149,83 +399,68 @@ logger = setup_logger('SemanticSearchService')
 #         faiss_index = self.index_text_df(text_df, '')
 #         result_df = self.use_index_to_search(faiss_index, search_text)
 #         return result_df.merge(text_df, on="docno", how="left")
-#
-#
-# class SemanticSearchServiceFactory:
-#     @staticmethod
-#     def create_semantic_search_service(config) -> SemanticSearchService:
-#         provider = config.get('semantic_search').get('provider')
-#         if provider == 'pyterrier':
-#             return PyTerrierService(config)
-#         elif provider in ['faiss-openai', 'faiss-huggingface']:
-#             return LangChainFAISSService(config)
-#         else:
-#             logger.error(f'SemanticSearchService for {provider} is not yet implemented.')
-#             raise NotImplementedError(f'SemanticSearchService - {provider} - is not supported')
 
 
-class BatchOpenAISemanticSearchService:
+class BatchOpenAISemanticSearchService(SemanticSearchService):
     def __init__(self, config, sender: Sender = None):
-        self.config = config
+        super().__init__(config, sender)
+        self.provider = 'openai'
+        self.embedding_model = BASE_MODEL
         openai.api_key = config.get('llm_service').get('openai_api').get('api_key')
-        self.sender = sender
+        self.embedding_cache = get_embedding_cache(config) if config.get('cache').get('is_enable').get('embedding') else None
+        openai_config = config.get('semantic_search').get('openai')
+        self.embedding_batch_scheduler = EmbeddingBatchScheduler(model=BASE_MODEL,
+                                                                 max_token_per_text=openai_config.get('max_token_per_text'),
+                                                                 max_token_per_batch=openai_config.get('max_token_per_batch'),
+                                                                 max_text_per_batch=openai_config.get('max_text_per_batch'),
+                                                                 max_workers=openai_config.get('max_workers'),
+                                                                 rate_limit_scheduler=get_rate_limit_scheduler(config, 'openai_embedding'))
 
-    @staticmethod
-    def batch_call_embeddings(texts, chunk_size=1000):
+    def batch_call_embeddings(self, texts):
         texts = [text.replace("\n", " ") for text in texts]
-        embeddings = []
-        for i in range(0, len(texts), chunk_size):
-            response = openai.Embedding.create(
-                input=texts[i: i + chunk_size], engine=BASE_MODEL
-            )
-            embeddings += [r["embedding"] for r in response["data"]]
-        return embeddings
-
-    # 데이터프레임의 텍스트에 대한 임베딩을 계산하고 임베딩 열을 추가하여 반환
-    @staticmethod
-    def compute_embeddings_for_text_df(text_df: pd.DataFrame):
-        """Compute embeddings for a text_df and return the text_df with the embeddings column added."""
-        print(f'compute_embeddings_for_text_df() len(texts): {len(text_df)}')
-        text_df['text'] = text_df['text'].apply(lambda x: x.replace("\n", " "))
-        text_df['embedding'] = BatchOpenAISemanticSearchService.batch_call_embeddings(text_df['text'].tolist())
-        return text_df
+        return self.embedding_batch_scheduler.run(texts)
 
-    # 관련 소스를 검색하여 결과 데이터프레임을 반환
-    def search_related_source(self, text_df: pd.DataFrame, target_text, n=30):
-        if not self.config.get('source_service').get('is_use_source'):
-            col = ['name', 'url', 'url_id', 'snippet', 'text', 'similarities', 'rank', 'docno']
-            return pd.DataFrame(columns=col)
 
-        if self.sender is not None:
-            self.sender.send_message(msg_type=MSG_TYPE_SEARCH_STEP, msg="Searching from extracted text")
-        print(f'search_similar() text: {target_text}')
-        embedding = BatchOpenAISemanticSearchService.batch_call_embeddings([target_text])[0]
-        text_df = BatchOpenAISemanticSearchService.compute_embeddings_for_text_df(text_df)
-        text_df['similarities'] = text_df['embedding'].apply(lambda x: cosine_similarity(x, embedding))
-        result_df = text_df.sort_values('similarities', ascending=False).head(n)
-        result_df['rank'] = range(1, len(result_df) + 1)
-        result_df['docno'] = range(1, len(result_df) + 1)
-        return result_df
+class HashingSemanticSearchService(SemanticSearchService):
+    """
+    Offline embedding on local CPU: hashed character n-gram counts (signed hashing trick),
+    which is a fixed random projection of the n-gram space. No model file and no network call is needed.
+    """
 
-    # GPT 입력 데이터프레임을 후처리하여 반환
-    @staticmethod
-    def post_process_gpt_input_text_df(gpt_input_text_df, prompt_token_limit):
-        # clean out of prompt texts for existing [1], [2], [3]... in the source_text for response output stability([1], [2], [3]... 제거)
-        gpt_input_text_df['text'] = gpt_input_text_df['text'].apply(lambda x: re.sub(r'\[[0-9]+\]', '', x))
-        # length of char and token( 문자열 길이, 토큰 계산)
-        gpt_input_text_df['len_text'] = gpt_input_text_df['text'].apply(lambda x: len(x))
-        gpt_input_text_df['len_token'] = gpt_input_text_df['text'].apply(lambda x: num_tokens_from_string(x))
+    def __init__(self, config, sender: Sender = None):
+        super().__init__(config, sender)
+        from sklearn.feature_extraction.text import HashingVectorizer
 
-        # 누적 문자열 길이와 개수
-        gpt_input_text_df['cumsum_len_text'] = gpt_input_text_df['len_text'].cumsum()
-        gpt_input_text_df['cumsum_len_token'] = gpt_input_text_df['len_token'].cumsum()
+        hashing_config = self.config.get('semantic_search').get('hashing')
+        n_features = hashing_config.get('n_features')
+        analyzer = hashing_config.get('analyzer')
+        ngram_range = tuple(hashing_config.get('ngram_range'))
+        self.provider = 'hashing'
+        self.embedding_model = f"hashing-{analyzer}-{ngram_range[0]}-{ngram_range[1]}-{n_features}"
+        self.batch_size = hashing_config.get('batch_size')
+        self.num_threads = hashing_config.get('num_threads')
+        self.vectorizer = HashingVectorizer(n_features=n_features, analyzer=analyzer, ngram_range=ngram_range,
+                                            lowercase=True, alternate_sign=True, norm=None, dtype=np.float32)
+        # local embedding is cheaper than a cache lookup, thus embedding_cache is not used
 
-        max_rank = gpt_input_text_df[gpt_input_text_df['cumsum_len_token'] <= prompt_token_limit]['rank'].max() + 1
-        gpt_input_text_df['in_scope'] = gpt_input_text_df['rank'] <= max_rank  # In order to get also the row slightly larger than prompt_length_limit
-        # reorder url_id with url that in scope.
-        url_id_list = gpt_input_text_df['url_id'].unique()
-        url_id_map = dict(zip(url_id_list, range(1, len(url_id_list) + 1)))
-        gpt_input_text_df['url_id'] = gpt_input_text_df['url_id'].map(url_id_map)
-        return gpt_input_text_df
+    def batch_call_embeddings(self, texts):
+        batches = [texts[i: i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            results = list(executor.map(self.vectorizer.transform, batches))
+        embeddings = []
+        for result in results:
+            embeddings += list(result.toarray())
+        return embeddings
 
 
+class SemanticSearchServiceFactory:
+    @staticmethod
+    def create_semantic_search_service(config, sender: Sender = None) -> SemanticSearchService:
+        provider = config.get('semantic_search').get('provider')
+        if provider == 'openai':
+            return BatchOpenAISemanticSearchService(config, sender)
+        elif provider == 'hashing':
+            return HashingSemanticSearchService(config, sender)
+        else:
+            logger.error(f'SemanticSearchService for {provider} is not yet implemented.')
+            raise NotImplementedError(f'SemanticSearchService - {provider} - is not supported')
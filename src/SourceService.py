@@ -4,6 +4,9 @@ import os
 import pandas as pd
 
 from BingService import BingService
+from DocIndexService import get_doc_index_service
+from SemanticSearchService import SemanticSearchServiceFactory
+from TextDfUtil import build_text_df
 from Util import setup_logger
 from text_extract.doc import support_doc_type, doc_extract_svc_map
 from text_extract.doc.abc_doc_extract import AbstractDocExtractSvc
@@ -33,17 +36,48 @@ class SourceService:
         # 웹사이트에서 문장 추출 및 병렬 처리로 데이터프레임 생성
         if self.sender is not None:
             self.sender.send_message(msg_type=MSG_TYPE_SEARCH_STEP, msg="Extracting sentences from bing search result ...")
-        bing_text_df = bing_service.call_urls_and_extract_sentences_concurrent(website_df=website_df)
+        if self.config['source_service']['bing_search']['fetcher'] == 'async':
+            bing_text_df = bing_service.call_urls_and_extract_sentences_async(website_df=website_df)
+        else:
+            bing_text_df = bing_service.call_urls_and_extract_sentences_concurrent(website_df=website_df)
 
         return bing_text_df
 
+    # 웹(Bing) 검색 결과의 스니펫만으로 데이터 추출 (웹페이지 호출 없음)
+    def extract_bing_snippet_text_df(self, search_text):
+        if not self.config['source_service']['is_use_source'] or not self.config['source_service']['is_enable_bing_search']:
+            return None
+
+        bing_service = BingService(self.config)
+        if self.sender is not None:
+            self.sender.send_message(msg_type=MSG_TYPE_SEARCH_STEP, msg="Calling bing search API")
+        website_df = bing_service.call_bing_search_api(search_text=search_text)
+        return bing_service.get_snippet_text_df(website_df)
+
+    # 웹(Bing)에서 웹사이트별 데이터를 완료되는 순서대로 추출
+    def iter_bing_text_df(self, search_text):
+        """Streaming version of extract_bing_text_df: yield the text_df of one website at a time, in the order the websites finish"""
+        if not self.config['source_service']['is_use_source'] or not self.config['source_service']['is_enable_bing_search']:
+            return
+
+        bing_service = BingService(self.config)
+        if self.sender is not None:
+            self.sender.send_message(msg_type=MSG_TYPE_SEARCH_STEP, msg="Calling bing search API")
+        website_df = bing_service.call_bing_search_api(search_text=search_text)
+        if self.sender is not None:
+            self.sender.send_message(msg_type=MSG_TYPE_SEARCH_STEP, msg="Extracting sentences from bing search result ...")
+        yield from bing_service.iter_urls_and_extract_sentences(website_df)
+
     # 문서에서 데이터 추출
-    def extract_doc_text_df(self, bing_text_df):
+    def extract_doc_text_df(self, bing_text_df, search_text=None):
         # DocSearch using doc_search_path
         #  bing_text_df is used for doc_id arrangement
         # 문서 검색을 사용할 지 여부를 확인하고, 사용하지 않으면 빈 데이터프레임 반환
         if not self.config['source_service']['is_use_source'] or not self.config['source_service']['is_enable_doc_search']:
             return pd.DataFrame([])
+        # 인덱스 사용 시, 전체 문서를 읽지 않고 인덱스에서 관련 문장만 가져옴
+        if self.config['source_service']['doc_index']['is_enable'] and search_text is not None:
+            return self.extract_doc_text_df_from_index(bing_text_df, search_text)
         # 문서 검색 경로에서 지원하는 문서 유형에 해당하는 파일 목록 가져오기
         if self.sender is not None:
             self.sender.send_message(msg_type=MSG_TYPE_SEARCH_STEP, msg="Extracting sentences from document")
@@ -53,7 +87,7 @@ class SourceService:
             files_grabbed.extend({"file_path": file_path, "doc_type": doc_type} for file_path in tmp_file_list)
 
         logger.info(f"File list: {files_grabbed}")
-        doc_sentence_list = list()
+        site_list, sentences_list = [], []
         # Bing 검색 결과를 기준으로 문서 ID 부여
         start_doc_id = 1 if bing_text_df is None else bing_text_df['url_id'].max() + 1
 
@@ -63,14 +97,17 @@ class SourceService:
             sentence_list = extract_svc.extract_from_doc(file['file_path'])
 
             file_name = file['file_path'].split(os.sep)[-1]
-            for sentence in sentence_list:
-                # 추출된 문장 정보를 리스트에 추가
-                doc_sentence_list.append({
-                    'name': file_name,
-                    'url': file['file_path'],
-                    'url_id': doc_id,
-                    'snippet': '',
-                    'text': sentence
-                })
-        doc_text_df = pd.DataFrame(doc_sentence_list)
+            site_list.append((file_name, file['file_path'], doc_id, ''))
+            sentences_list.append(sentence_list)
+        doc_text_df = build_text_df(site_list, sentences_list)
         return doc_text_df
+
+    # 문서 인덱스(ANN)에서 검색어와 관련된 문장 추출
+    def extract_doc_text_df_from_index(self, bing_text_df, search_text):
+        if self.sender is not None:
+            self.sender.send_message(msg_type=MSG_TYPE_SEARCH_STEP, msg="Searching from document index")
+        semantic_search_service = SemanticSearchServiceFactory.create_semantic_search_service(self.config)
+        doc_index_service = get_doc_index_service(self.config, semantic_search_service.embedding_model)
+        start_doc_id = 1 if bing_text_df is None else bing_text_df['url_id'].max() + 1
+        top_k = self.config['source_service']['doc_index']['top_k']
+        return doc_index_service.search_doc_text_df(semantic_search_service, search_text, start_doc_id, top_k)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+TEXT_DF_COLUMNS = ['name', 'url', 'url_id', 'snippet', 'text']
+# columns repeated for every sentence of a site, stored once per site as categories(사이트 단위 컬럼은 카테고리로 한 번만 저장)
+SITE_COLUMNS = ['name', 'url', 'snippet']
+MIN_WORD_COUNT = 8  # approximate number of words of a usable sentence
+COUNT_WORDS_CHUNK_SIZE = 256
+# ascii part of the regex \w (alphanumeric or underscore), other code points are looked up once per distinct character
+ASCII_WORD_CHAR = np.array([chr(code).isalnum() or chr(code) == '_' for code in range(128)])
+
+
+def count_words(texts) -> np.ndarray:
+    r"""
+    Number of regex \w+ matches of every text, on the code points of many texts at once instead of one regex call per text
+    Input: ['Hello, wörld!', '', 'one_two 3']
+    Output: array([2, 0, 2])
+    """
+    word_count = np.zeros(len(texts), dtype=np.int64)
+    for i in range(0, len(texts), COUNT_WORDS_CHUNK_SIZE):  # chunks bound the size of the temporary code point arrays
+        chunk = texts[i: i + COUNT_WORDS_CHUNK_SIZE]
+        joined = '\n'.join(chunk)  # separator is not a word character, thus words never span two texts
+        codes = np.frombuffer(joined.encode('utf-32-le', errors='surrogatepass'), dtype=np.uint32)
+        is_ascii = codes < 128
+        is_word = np.zeros(len(codes), dtype=bool)
+        is_word[is_ascii] = ASCII_WORD_CHAR[codes[is_ascii]]
+        if not is_ascii.all():
+            unique_codes, inverse = np.unique(codes[~is_ascii], return_inverse=True)
+            is_word[~is_ascii] = np.array([chr(code).isalnum() for code in unique_codes])[inverse]
+        is_word[1:] &= ~np.roll(is_word, 1)[1:]  # keep the first character of every word
+        text_end = np.cumsum([len(text) + 1 for text in chunk])
+        word_count[i: i + len(chunk)] = np.bincount(np.searchsorted(text_end, np.flatnonzero(is_word), side='right'), minlength=len(chunk))
+    return word_count
+
+
+def build_text_df(site_list, sentences_list, min_word_count: int = 0) -> pd.DataFrame:
+    """
+    Build text_df column by column: one row = one sentence, sites in the given order
+    name / url / snippet are categorical (int codes + one string per site), url_id is an int column
+    Input: site_list=[('A', 'https://a.com', 0, 'snippet of a')], sentences_list=[['first sentence of a', 'second sentence of a']]
+    Output: text_df with columns name, url, url_id, snippet, text
+    """
+    site_index = np.repeat(np.arange(len(site_list)), [len(sentences) for sentences in sentences_list])
+    text_list = [text for sentences in sentences_list for text in sentences]
+    if min_word_count > 0:
+        is_usable = count_words(text_list) >= min_word_count
+        site_index, text_list = site_index[is_usable], [text for text, usable in zip(text_list, is_usable) if usable]
+
+    site_columns = list(zip(*site_list)) if site_list else [()] * 4
+    data = {}
+    for column, values in zip(['name', 'url', 'url_id', 'snippet'], site_columns):
+        if column in SITE_COLUMNS:
+            codes, categories = pd.factorize(pd.Series(values, dtype=object))
+            data[column] = pd.Categorical.from_codes(codes[site_index], categories=categories)
+        else:
+            data[column] = np.asarray(values, dtype=np.int64)[site_index]
+    data['text'] = pd.Series(text_list, dtype=object)
+    return pd.DataFrame(data, columns=TEXT_DF_COLUMNS)
+
+
+def concat_text_df(text_df_list) -> pd.DataFrame:
+    """
+    pd.concat of text_dfs, the categorical columns stay categorical: categories are unioned and only the int codes are rebuilt
+    Object columns of the other text_dfs (e.g. documents) are converted to categorical first.
+    """
+    text_df_list = [text_df for text_df in text_df_list if text_df is not None and len(text_df) > 0]
+    if len(text_df_list) == 0:
+        return build_text_df([], [])
+    if len(text_df_list) == 1:
+        return text_df_list[0].reset_index(drop=True)
+
+    data = {}
+    for column in TEXT_DF_COLUMNS:
+        series_list = [text_df[column] for text_df in text_df_list]
+        if column in SITE_COLUMNS:
+            data[column] = union_categoricals([series if isinstance(series.dtype, pd.CategoricalDtype) else pd.Categorical(series.astype(object))
+                                               for series in series_list])
+        else:
+            data[column] = pd.concat(series_list, ignore_index=True)
+    return pd.DataFrame(data, columns=TEXT_DF_COLUMNS)
@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+
+import tiktoken
+
+from Util import setup_logger
+
+logger = setup_logger('TokenizerService')
+
+DEFAULT_TOKENIZER_MODEL = 'gpt-3.5-turbo'
+MAX_NUMBER_OF_MEMO = 50000  # token counts kept per model, least recently used first out
+
+
+class TokenizerService:
+    """
+    Token counting of one model
+    - the encoding is loaded once (the first load reads the BPE file, later calls reuse it)
+    - counts are memoized per text, sentences repeated across searches / sources are not encoded again
+    - count_tokens_batch encodes all memo misses in one encode_batch call (native threads of tiktoken)
+    """
+
+    def __init__(self, model: str, max_number_of_memo: int = MAX_NUMBER_OF_MEMO):
+        self.model = model
+        self.encoding = tiktoken.encoding_for_model(model)
+        self.max_number_of_memo = max_number_of_memo
+        self.count_memo = OrderedDict()  # text -> number of tokens
+        self.lock = threading.Lock()
+
+    def count_tokens(self, text: str, is_memoized: bool = True) -> int:
+        if not is_memoized:  # one-off long texts (e.g. a whole prompt) would only push sentences out of the memo
+            return len(self.encoding.encode(text))
+        return self.count_tokens_batch([text])[0]
+
+    def count_tokens_batch(self, texts) -> list:
+        """
+        Input: ['Hello world', 'Hello world', 'ChatGPT']
+        Output: [2, 2, 3]
+        """
+        counts = [None] * len(texts)
+        with self.lock:
+            for i, text in enumerate(texts):
+                count = self.count_memo.get(text)
+                if count is not None:
+                    self.count_memo.move_to_end(text)
+                    counts[i] = count
+        miss_text_list = list(dict.fromkeys(text for text, count in zip(texts, counts) if count is None))
+        if not miss_text_list:
+            return counts
+
+        miss_count_dict = {text: len(tokens) for text, tokens in zip(miss_text_list, self.encoding.encode_batch(miss_text_list))}
+        with self.lock:
+            self.count_memo.update(miss_count_dict)
+            while len(self.count_memo) > self.max_number_of_memo:
+                self.count_memo.popitem(last=False)
+        return [count if count is not None else miss_count_dict[text] for text, count in zip(texts, counts)]
+
+
+# one tokenizer per model per process, shared by all requests(프로세스 당 모델별 토크나이저 하나를 공유)
+tokenizer_service_dict = {}
+tokenizer_service_dict_lock = threading.Lock()
+
+
+def get_tokenizer_service(model: str = DEFAULT_TOKENIZER_MODEL) -> TokenizerService:
+    with tokenizer_service_dict_lock:
+        if model not in tokenizer_service_dict:
+            tokenizer_service_dict[model] = TokenizerService(model)
+        return tokenizer_service_dict[model]
+
+
+def preload_tokenizer_services(models):
+    # at worker start, thus the first request does not pay the encoding load(워커 시작 시 인코딩을 미리 로드)
+    for model in models:
+        try:
+            get_tokenizer_service(model)
+        except Exception as ex:  # e.g. no network to download the encoding, retried by the first request
+            logger.warning(f"preload_tokenizer_services. failed to load the encoding of {model}: {type(ex).__name__}: {ex}")
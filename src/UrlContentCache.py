@@ -0,0 +1,133 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from Util import setup_logger, get_project_root
+
+logger = setup_logger('UrlContentCache')
+
+
+class UrlContentCache:
+    """
+    Per-URL store of fetched html and extracted sentences on local disk (sqlite)
+    - key: (url, extractor), thus one changed url in a search result does not miss the other pages
+    - fresh (younger than ttl): sentences are served without network
+    - stale: revalidated by a conditional GET with the stored ETag / Last-Modified, 304 keeps the sentences
+    - eviction: least recently used pages are deleted once max_number_of_page is exceeded
+    """
+
+    def __init__(self, db_path: Path, ttl: int = 86400, max_number_of_page: int = 5000):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_number_of_page = max_number_of_page
+        self.hit_count = 0
+        self.revalidated_count = 0
+        self.miss_count = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(db_path.parent, exist_ok=True)
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS page ('
+                          'url TEXT NOT NULL, '
+                          'extractor TEXT NOT NULL, '
+                          'html BLOB, '
+                          'sentences TEXT NOT NULL, '
+                          'etag TEXT, '
+                          'last_modified TEXT, '
+                          'fetched_at REAL NOT NULL, '
+                          'last_access REAL NOT NULL, '
+                          'PRIMARY KEY (url, extractor))')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_page_last_access ON page (last_access)')
+        self.conn.commit()
+
+    def get(self, url: str, extractor: str):
+        """
+        :return: None if never fetched, else dict(sentences, etag, last_modified, is_fresh)
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT sentences, etag, last_modified, fetched_at FROM page WHERE url = ? AND extractor = ?',
+                                    (url, extractor)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute('UPDATE page SET last_access = ? WHERE url = ? AND extractor = ?', (time.time(), url, extractor))
+            self.conn.commit()
+        sentences, etag, last_modified, fetched_at = row
+        return {'sentences': json.loads(sentences), 'etag': etag, 'last_modified': last_modified,
+                'is_fresh': time.time() - fetched_at < self.ttl}
+
+    @staticmethod
+    def get_revalidation_headers(entry) -> dict:
+        """
+        Input: {'etag': '"abc"', 'last_modified': 'Wed, 21 Oct 2015 07:28:00 GMT', ...}
+        Output: {'If-None-Match': '"abc"', 'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+        """
+        headers = {}
+        if entry is not None and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url: str, extractor: str, html_bytes: bytes, sentences: list, etag=None, last_modified=None):
+        now = time.time()
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO page (url, extractor, html, sentences, etag, last_modified, fetched_at, last_access) '
+                              'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              (url, extractor, zlib.compress(html_bytes), json.dumps(sentences, ensure_ascii=False),
+                               etag, last_modified, now, now))
+            self.conn.commit()
+            self.evict_least_recently_used()
+
+    def mark_revalidated(self, url: str, extractor: str):
+        # 304 Not Modified: keep the content, restart the ttl(내용은 유지하고 ttl만 갱신)
+        now = time.time()
+        with self.lock:
+            self.conn.execute('UPDATE page SET fetched_at = ?, last_access = ? WHERE url = ? AND extractor = ?', (now, now, url, extractor))
+            self.conn.commit()
+
+    def count(self, is_hit: bool = False, is_revalidated: bool = False):
+        with self.lock:
+            if is_hit:
+                self.hit_count += 1
+            elif is_revalidated:
+                self.revalidated_count += 1
+            else:
+                self.miss_count += 1
+
+    def evict_least_recently_used(self):
+        number_of_page = self.conn.execute('SELECT COUNT(*) FROM page').fetchone()[0]
+        number_to_evict = number_of_page - self.max_number_of_page
+        if number_to_evict <= 0:
+            return
+        logger.info(f"UrlContentCache.evict_least_recently_used. number_to_evict: {number_to_evict}")
+        self.conn.execute('DELETE FROM page WHERE rowid IN (SELECT rowid FROM page ORDER BY last_access ASC LIMIT ?)', (number_to_evict,))
+        self.conn.commit()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            number_of_page = self.conn.execute('SELECT COUNT(*) FROM page').fetchone()[0]
+        return {'hit_count': self.hit_count,
+                'revalidated_count': self.revalidated_count,
+                'miss_count': self.miss_count,
+                'number_of_page': number_of_page,
+                'max_number_of_page': self.max_number_of_page}
+
+
+# one store per db file per process, shared by all requests(프로세스 당 하나의 캐시 인스턴스를 공유)
+url_content_cache_dict = {}
+url_content_cache_dict_lock = threading.Lock()
+
+
+def get_url_content_cache(config) -> UrlContentCache:
+    cache_config = config.get('cache')
+    db_path = Path(get_project_root(), cache_config.get('path'), 'url_content', 'url_content.sqlite3')
+    with url_content_cache_dict_lock:
+        if db_path not in url_content_cache_dict:
+            url_content_cache_dict[db_path] = UrlContentCache(db_path, cache_config.get('url_content_ttl'), cache_config.get('max_number_of_url_content'))
+        return url_content_cache_dict[db_path]
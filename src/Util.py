@@ -1,7 +1,10 @@
+import concurrent.futures
 import logging
 import os
 import pickle
 import re
+import threading
+import time
 from copy import deepcopy
 from functools import wraps
 from hashlib import md5
@@ -110,6 +113,85 @@ def storage_cached(cache_type: str, cache_hash_key_name: str):
     return storage_cache_decorator
 
 
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key: the first caller runs the function, the others wait for its result
+    - thread: callers within one process share a future
+    - file: additionally, callers of other processes (e.g. gunicorn workers) wait on an fcntl lock of the key
+            and read the result written by the process holding the lock
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.future_dict = {}
+
+    def do(self, key: str, func, file_lock_dir: Path = None):
+        with self.lock:
+            future = self.future_dict.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = concurrent.futures.Future()
+                self.future_dict[key] = future
+        if not is_leader:
+            return deepcopy(future.result())  # every caller gets its own copy, as with storage_cached
+
+        try:
+            result = func() if file_lock_dir is None else self.do_with_file_lock(key, func, file_lock_dir)
+            future.set_result(result)
+            return result
+        except BaseException as ex:
+            future.set_exception(ex)
+            raise
+        finally:
+            with self.lock:
+                del self.future_dict[key]
+
+    @staticmethod
+    def do_with_file_lock(key: str, func, file_lock_dir: Path):
+        import fcntl
+
+        start_time = time.time()
+        os.makedirs(file_lock_dir / 'single_flight_lock', exist_ok=True)
+        with open(file_lock_dir / 'single_flight_lock' / f'{key}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # another process finished the same call while this one was waiting for the lock
+                result_path = file_lock_dir / 'single_flight' / f'{key}.pickle'
+                if os.path.exists(result_path) and os.path.getmtime(result_path) >= start_time:
+                    return load_result_from_cache(file_lock_dir, key, 'single_flight')['result']
+                result = func()
+                save_result_cache(file_lock_dir, key, 'single_flight', result=result)
+                check_max_number_of_cache(file_lock_dir, 'single_flight', SINGLE_FLIGHT_MAX_NUMBER_OF_RESULT)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+single_flight_group = SingleFlight()
+SINGLE_FLIGHT_MAX_NUMBER_OF_RESULT = 100  # results of the file mode are only read by callers waiting at the same time
+
+
+# 동일한 호출이 동시에 진행 중이면 새로 실행하지 않고 먼저 시작된 호출의 결과를 기다림 (storage_cached 위에 적용)
+def single_flight(flight_type: str, flight_key_name: str):
+    def single_flight_decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            assert getattr(args[0], 'config'), 'single_flight is only applicable to class method with config attribute'
+            assert flight_key_name in kwargs, f'Target method does not have {flight_key_name} keyword argument'
+
+            config = getattr(args[0], 'config')
+            mode = config.get('cache').get('single_flight_mode')
+            if mode not in ['thread', 'file']:
+                return func(*args, **kwargs)
+            key = md5(str(config).encode() + flight_type.encode() + str(kwargs[flight_key_name]).encode()).hexdigest()
+            file_lock_dir = Path(get_project_root(), config.get('cache').get('path')) if mode == 'file' else None
+            return single_flight_group.do(key, lambda: func(*args, **kwargs), file_lock_dir)
+
+        return wrapper
+
+    return single_flight_decorator
+
+
 if __name__ == '__main__':
     text = "There are many things you can do to learn how to run faster, Mr. Wan, such as incorporating speed workouts into your running schedule, running hills, counting your strides, and adjusting your running form. Lean forward when you run and push off firmly with each foot. Pump your arms actively and keep your elbows bent at a 90-degree angle. Try to run every day, and gradually increase the distance you run for long-distance runs. Make sure you rest at least one day per week to allow your body to recover. Avoid running with excess gear that could slow you down."
     sentences = split_sentences_from_paragraph(text)
@@ -0,0 +1,10 @@
+from .beautiful_soup import BeautifulSoupSvc
+from .lxml_html import LxmlHtmlSvc
+from .trafilatura import TrafilaturaSvc
+
+support_html_extract_svc = ['beautifulsoup', 'trafilatura', 'lxml']
+html_extract_svc_class_map = {
+    'beautifulsoup': BeautifulSoupSvc,
+    'trafilatura': TrafilaturaSvc,
+    'lxml': LxmlHtmlSvc
+}
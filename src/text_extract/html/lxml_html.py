@@ -0,0 +1,72 @@
+import re
+
+import lxml.html
+from lxml import etree
+
+from text_extract.html.abc_html_extract import AbstractHtmlExtractSvc
+
+# never main content
+REMOVE_TAG_LIST = ['script', 'style', 'noscript', 'template', 'svg', 'iframe', 'form', 'button', 'select', 'nav', 'header', 'footer', 'aside']
+# text blocks considered as paragraphs
+BLOCK_TAG_SET = {'p', 'li', 'blockquote', 'pre', 'dd', 'td', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+# whole words of class / id ('site-footer', 'share_buttons', 'mw-navigation'), never substrings ('shared-content' is content)
+BOILERPLATE_WORD_SET = {'nav', 'navbar', 'navigation', 'menu', 'footer', 'header', 'sidebar', 'comment', 'comments', 'cookie', 'cookies',
+                        'share', 'sharing', 'social', 'ad', 'ads', 'advert', 'advertisement', 'promo', 'banner', 'breadcrumb', 'breadcrumbs',
+                        'related', 'subscribe', 'newsletter'}
+ATTRIBUTE_WORD_SEPARATOR = re.compile(r'[\s\-_]+')
+# containers of the whole page or of the main content, never dropped whatever their class
+PROTECTED_TAG_SET = {'html', 'body', 'main', 'article'}
+MAX_LINK_DENSITY = 0.5  # blocks that are mostly link text are navigation
+MIN_BLOCK_LENGTH = 20
+
+
+class LxmlHtmlSvc(AbstractHtmlExtractSvc):
+    """
+    Paragraph extraction on the libxml2 (C) parser with a cheap boilerplate heuristic
+    - drop non-content tags and subtrees whose class / id words look like navigation, comments, ads, ...
+    - keep block elements (p, li, headings, ...) that are long enough and not mostly link text
+    """
+
+    def __init__(self):
+        super().__init__()
+
+    @staticmethod
+    def is_boilerplate(element) -> bool:
+        """
+        Input: <div class="sidebar-widget">  /  <div class="shared-content">
+        Output: True  /  False
+        """
+        attribute = f"{element.get('class') or ''} {element.get('id') or ''}".lower()
+        return not BOILERPLATE_WORD_SET.isdisjoint(ATTRIBUTE_WORD_SEPARATOR.split(attribute))
+
+    def is_droppable(self, element) -> bool:
+        if element.tag in PROTECTED_TAG_SET or element.getparent() is None or not self.is_boilerplate(element):
+            return False
+        # a wrapper like <div class="site has-sidebar"> holding the main content is not boilerplate(본문을 포함한 요소는 유지)
+        return not any(not self.is_boilerplate(content) for content in element.xpath('.//main | .//article | .//*[@role="main"]'))
+
+    def extract_from_html(self, html_str: str):
+        try:
+            tree = lxml.html.fromstring(html_str)
+        except ValueError:  # unicode string with an <?xml encoding=...?> declaration
+            tree = lxml.html.fromstring(html_str.encode('utf-8'))
+        except etree.ParserError:  # empty document
+            return []
+
+        etree.strip_elements(tree, etree.Comment, *REMOVE_TAG_LIST, with_tail=False)
+        for element in list(tree.iter(etree.Element)):
+            if self.is_droppable(element):
+                element.drop_tree()
+
+        paragraph_list = []
+        for element in tree.iter(*BLOCK_TAG_SET):
+            if any(ancestor.tag in BLOCK_TAG_SET for ancestor in element.iterancestors()):
+                continue  # text of nested blocks is already in the outer block
+            text = ' '.join(element.text_content().split())
+            if len(text) < MIN_BLOCK_LENGTH:
+                continue
+            link_text_length = sum(len(link.text_content()) for link in element.iter('a'))
+            if link_text_length / len(text) > MAX_LINK_DENSITY:
+                continue
+            paragraph_list.append(text)
+        return paragraph_list
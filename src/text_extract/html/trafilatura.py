@@ -5,12 +5,17 @@ from text_extract.html.abc_html_extract import AbstractHtmlExtractSvc
 
 
 class TrafilaturaSvc(AbstractHtmlExtractSvc):
-    def __init__(self):
+    def __init__(self, reset_cache_interval: int = 1):
         super().__init__()
+        # trafilatura caches grow with every page, they are cleared once per reset_cache_interval pages
+        self.reset_cache_interval = reset_cache_interval
+        self.number_of_extract = 0
 
     def extract_from_html(self, html_str: str):
         extract = bare_extraction(html_str, favor_precision=True)
-        reset_caches()
+        self.number_of_extract += 1
+        if self.number_of_extract % self.reset_cache_interval == 0:
+            reset_caches()
         try:
             return extract['text'].split("\n")
         except:
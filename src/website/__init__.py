@@ -1,3 +1,6 @@
+import os
+
+import yaml
 from flask import Flask
 
 
@@ -8,4 +11,10 @@ def create_app():
     from .views import views
     app.register_blueprint(views, url_prefix='/')
 
+    from TokenizerService import preload_tokenizer_services
+    from Util import get_project_root
+    with open(os.path.join(get_project_root(), 'src/config/config.yaml'), encoding='utf-8') as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    preload_tokenizer_services(config.get('tokenizer').get('preload_models'))
+
     return app
@@ -1,11 +1,38 @@
+import queue
+import threading
+import time
+
 from flask import render_template
 
 MSG_TYPE_SEARCH_STEP = 'search-step'
 MSG_TYPE_OPEN_AI_STREAM = 'openai-stream'
+MSG_TYPE_DONE = 'done'
 
 # global var to store progress. Native polling 'socket'
 exporting_progress = {}
 
+# per-request event queues read by the /stream endpoint (Server-Sent Events)(요청별 SSE 이벤트 큐)
+event_queue_dict = {}
+event_queue_dict_lock = threading.Lock()
+EVENT_QUEUE_TTL = 600  # seconds a queue nobody reads is kept
+
+
+def get_event_queue(request_id: str) -> queue.Queue:
+    """Queue of the events of request_id, created by whichever comes first: the search or the stream"""
+    now = time.time()
+    with event_queue_dict_lock:
+        for stale_request_id in [key for key, (_, created_at) in event_queue_dict.items() if now - created_at > EVENT_QUEUE_TTL]:
+            del event_queue_dict[stale_request_id]
+        if request_id not in event_queue_dict:
+            event_queue_dict[request_id] = (queue.Queue(), now)
+        return event_queue_dict[request_id][0]
+
+
+def remove_event_queue(request_id: str, event_queue: queue.Queue):
+    with event_queue_dict_lock:
+        if request_id in event_queue_dict and event_queue_dict[request_id][0] is event_queue:
+            del event_queue_dict[request_id]
+
 
 class Sender:
     def __init__(self, request_id: str):
@@ -13,16 +40,27 @@ class Sender:
         self.received_step_events = []
         self.openai_stream = ''
         self.search_result_step_html = ''
+        self.event_queue = get_event_queue(request_id)
+        # events of an earlier search of the same page nobody has read(같은 페이지의 이전 검색에서 남은 이벤트 제거)
+        while not self.event_queue.empty():
+            self.event_queue.get_nowait()
 
     def send_message(self, msg_type, msg: str):
         if msg_type == MSG_TYPE_SEARCH_STEP:
             self.received_step_events.append(msg)
             self.search_result_step_html = render_template('search_result_step.html',
                                                            search_result_step_json=[{'msg': received_msg} for received_msg in self.received_step_events])
+            # stream event: html of the new step only(새 단계의 html만 전송)
+            self.event_queue.put((msg_type, render_template('search_result_step.html', search_result_step_json=[{'msg': msg}])))
         elif msg_type == MSG_TYPE_OPEN_AI_STREAM:
             self.openai_stream += msg
+            self.event_queue.put((msg_type, msg))  # stream event: the new delta only
         else:
             pass
         global exporting_progress
         exporting_progress[self.request_id] = {'html': self.search_result_step_html,
                                                'openai_stream': self.openai_stream}
+
+    def close(self, status: str = 'done'):
+        # last event, the stream of this request ends after it(마지막 이벤트, 이후 스트림 종료)
+        self.event_queue.put((MSG_TYPE_DONE, status))
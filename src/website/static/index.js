@@ -15,6 +15,32 @@ $(document).ready(function () {
         );
     }
 
+    // search steps and LLM tokens pushed by the server as they happen (Server-Sent Events), only new data per event
+    let open_stream = function () {
+        if (typeof EventSource === 'undefined') {
+            return false;
+        }
+        let openai_stream = '';
+        let stream = new EventSource('/stream?request_id=' + encodeURIComponent($('#request_id').val()));
+        $('#search-result-step').html('');
+        stream.addEventListener('search-step', function (event) {
+            $('#search-result-step').append(JSON.parse(event.data));
+        });
+        stream.addEventListener('openai-stream', function (event) {
+            openai_stream += JSON.parse(event.data);
+            if ($('#result-text').length) {
+                $('#result-text')[0].innerText = openai_stream;
+            }
+        });
+        stream.addEventListener('done', function () {
+            stream.close();
+        });
+        stream.onerror = function () {
+            stream.close(); // no automatic reconnect, the search response has the full result anyway
+        };
+        return true;
+    }
+
     let submit_search = function (is_poll, event) {
         if (event) {
             event.preventDefault();
@@ -36,6 +62,7 @@ $(document).ready(function () {
                 bing_search_subscription_key: $('#bing_search_subscription_key').val(),
                 openai_api_key: $('#openai_api_key').val(),
                 is_use_source: $('input[name="is_use_source"]')[0].checked,
+                is_snippet_only: $('input[name="is_snippet_only"]')[0].checked,
                 llm_service_provider: $('#llm_service_provider').val(),
                 llm_model: $('#llm_model').val(),
                 language: $('#language').val()
@@ -60,8 +87,8 @@ $(document).ready(function () {
             }
         })
 
-        // call 10 times progress each sec
-        if (is_poll) {
+        // polling fallback for browsers without EventSource: call 15 times progress every 2 sec
+        if (!open_stream() && is_poll) {
             CALL_TIMES = 15; // 2 sec for 30 sec
             for (let i = 1; i < CALL_TIMES + 1; i++) {
                 setTimeout(refresh_progress, 2000 * i);
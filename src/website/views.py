@@ -1,19 +1,29 @@
+import json
 import os
+import queue
 import random
 import string
+import time
 import tracemalloc
 
 import psutil
-from flask import Blueprint, render_template, request
+import yaml
+from flask import Blueprint, Response, render_template, request
 
+from AnswerCache import get_answer_cache
+from EmbeddingCache import get_embedding_cache
+from RateLimitScheduler import get_rate_limit_stats
 from SearchGPTService import SearchGPTService
 from FrontendService import FrontendService
-from Util import setup_logger
-from website.sender import exporting_progress, Sender
+from Util import setup_logger, get_project_root
+from website.sender import exporting_progress, Sender, MSG_TYPE_DONE, get_event_queue, remove_event_queue
 
 logger = setup_logger('Views')
 views = Blueprint('views', __name__)
 
+STREAM_KEEPALIVE_INTERVAL = 15  # seconds, a comment line keeps proxies from closing an idle stream and detects gone clients
+STREAM_TIMEOUT = 300  # seconds, a stream never outlives its search by much
+
 process = psutil.Process(os.getpid())
 tracemalloc.start()
 memory_snapshot = None
@@ -44,12 +54,14 @@ def index_page():
     data_json = {'response_json': [], 'source_json': []}
     request_id = request.values.get('request_id')
     search_text = request.values.get('q')
+    sender = None
 
     try:
         ui_overriden_config = {
             'bing_search_subscription_key': request.values.get('bing_search_subscription_key'),
             'openai_api_key': request.values.get('openai_api_key'),
             'is_use_source': request.values.get('is_use_source'),
+            'is_snippet_only': request.values.get('is_snippet_only'),
             'llm_service_provider': request.values.get('llm_service_provider'),
             'llm_model': request.values.get('llm_model'),
             'language': request.values.get('language'),
@@ -59,9 +71,15 @@ def index_page():
         if search_text is not None:
             sender = Sender(request_id) if request_id is not None and request_id != "" else None
             search_gpt_service = SearchGPTService(ui_overriden_config, sender)
-            _, _, data_json = search_gpt_service.query_and_get_answer(search_text=search_text)
+            if search_gpt_service.config['source_service']['snippet_only']['is_enable']:
+                _, _, data_json = search_gpt_service.query_and_get_snippet_answer(search_text)
+            else:
+                _, _, data_json = search_gpt_service.query_and_get_answer(search_text=search_text)
     except Exception as e:
         error = str(e)
+    finally:
+        if sender is not None:
+            sender.close('done' if error is None else 'error')
 
     if error is None:
         id = 'search-results'
@@ -93,6 +111,38 @@ def index_page():
     }
 
 
+# 검색 단계와 LLM 토큰을 발생 즉시 전송 (Server-Sent Events). 각 이벤트는 새 데이터만 포함
+@views.route('/stream')
+def stream():
+    """
+    Server-Sent Events of one search: 'search-step' (html of the new step), 'openai-stream' (new text delta),
+    then 'done' (done / error) and the response ends. data is JSON encoded.
+    """
+    request_id = request.values.get('request_id')
+    if not request_id:
+        return {'error': 'request_id is required'}, 400
+    event_queue = get_event_queue(request_id)
+
+    def generate():
+        end_time = time.monotonic() + STREAM_TIMEOUT
+        try:
+            while time.monotonic() < end_time:
+                try:
+                    msg_type, msg = event_queue.get(timeout=STREAM_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"event: {msg_type}\ndata: {json.dumps(msg)}\n\n"
+                if msg_type == MSG_TYPE_DONE:
+                    return
+            yield f"event: {MSG_TYPE_DONE}\ndata: {json.dumps('timeout')}\n\n"
+        finally:
+            remove_event_queue(request_id, event_queue)
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# polling fallback of /stream: the whole progress so far
 @views.route('/progress')
 def progress():
     request_id = request.values.get('request_id')
@@ -115,6 +165,30 @@ def print_memory():
     return {'memory': process.memory_info().rss}
 
 
+@views.route('/embedding_cache')
+def print_embedding_cache_stats():
+    with open(os.path.join(get_project_root(), 'src/config/config.yaml'), encoding='utf-8') as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    if not config.get('cache').get('is_enable').get('embedding'):
+        return {'is_enable': False}
+    return get_embedding_cache(config).get_stats()
+
+
+@views.route('/answer_cache')
+def print_answer_cache_stats():
+    with open(os.path.join(get_project_root(), 'src/config/config.yaml'), encoding='utf-8') as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    if not config.get('cache').get('is_enable').get('answer'):
+        return {'is_enable': False}
+    return get_answer_cache(config).get_stats()
+
+
+@views.route('/rate_limit')
+def print_rate_limit_stats():
+    # queue depth, waiting time and retries per provider API since the worker started
+    return get_rate_limit_stats()
+
+
 @views.route("/snapshot")
 def snap():
     global memory_snapshot
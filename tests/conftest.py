@@ -0,0 +1,44 @@
+import os
+import re
+import sys
+
+import pytest
+
+# modules of src/ import each other as top-level modules (e.g. from Util import setup_logger)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+
+class FakeEncoding:
+    """Offline stand-in of a tiktoken encoding: words, punctuation and newlines are tokens ('\\n\\n' is 2 tokens)"""
+
+    def __init__(self):
+        self.number_of_encode_call = 0
+        self.encoded_text_list = []
+
+    @staticmethod
+    def tokenize(text: str) -> list:
+        return re.findall(r'\w+|[^\w\s]|\n', text)
+
+    def encode(self, text: str) -> list:
+        self.number_of_encode_call += 1
+        self.encoded_text_list.append(text)
+        return self.tokenize(text)
+
+    def encode_batch(self, texts) -> list:
+        self.number_of_encode_call += 1
+        self.encoded_text_list.extend(texts)
+        return [self.tokenize(text) for text in texts]
+
+    def decode(self, tokens) -> str:
+        return ' '.join(tokens)
+
+
+@pytest.fixture
+def fake_encoding(monkeypatch):
+    """TokenizerService on FakeEncoding, with a fresh process-wide tokenizer dict (tiktoken would download the BPE file)"""
+    import TokenizerService
+
+    encoding = FakeEncoding()
+    monkeypatch.setattr(TokenizerService.tiktoken, 'encoding_for_model', lambda model: encoding)
+    monkeypatch.setattr(TokenizerService, 'tokenizer_service_dict', {})
+    return encoding
@@ -0,0 +1,14 @@
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+
+def test_app_imports_without_src_on_path():
+    # as gunicorn app:app / python app.py do: only the project root is on sys.path when src.website is imported
+    # (a fresh interpreter, conftest puts src/ on the sys.path of this one)
+    env = {key: value for key, value in os.environ.items() if key != 'PYTHONPATH'}
+    result = subprocess.run([sys.executable, '-c', 'import app; assert app.app is not None'], cwd=PROJECT_ROOT, env=env,
+                            capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
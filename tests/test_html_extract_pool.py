@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+
+import pytest
+
+import HtmlExtractPool
+from HtmlExtractPool import WORKER_READY
+
+
+def run_fake_worker(extract_svc_name, connection):
+    """Worker of these tests: b'sleep:<second>' takes that long, b'hang' never ends, b'crash' kills the process"""
+    connection.send(WORKER_READY)
+    while True:
+        try:
+            content, encoding = connection.recv()
+        except EOFError:
+            return
+        if content == b'hang':
+            time.sleep(3600)
+        elif content == b'crash':
+            os._exit(1)
+        elif content == b'error':
+            connection.send((None, ValueError('broken page')))
+        else:
+            time.sleep(float(content.split(b':')[1]))
+            connection.send(([content.decode(), os.getpid()], None))
+
+
+@pytest.fixture
+def get_pool(monkeypatch):
+    monkeypatch.setattr(HtmlExtractPool, 'run_worker', run_fake_worker)
+    pool_list = []
+
+    def get_pool(max_workers, extract_timeout):
+        pool = HtmlExtractPool.HtmlExtractPool('fake', max_workers, extract_timeout)
+        pool_list.append(pool)
+        # wait for the start-up of the workers, not part of what is tested
+        for future in [pool.submit(b'sleep:0') for _ in range(max_workers)]:
+            future.result()
+        return pool
+
+    yield get_pool
+    for pool in pool_list:
+        while not pool.idle_worker_queue.empty():
+            pool.idle_worker_queue.get().process.terminate()
+
+
+def test_waiting_for_a_free_worker_is_not_timed(get_pool):
+    pool = get_pool(max_workers=1, extract_timeout=0.5)
+    future_list = [pool.submit(b'sleep:0.3') for _ in range(4)]  # the last one waits 0.9s before it starts
+    assert [future.result()[0] for future in future_list] == ['sleep:0.3'] * 4
+
+
+def get_worker_pid_set(pool):
+    return {worker.process.pid for worker in list(pool.idle_worker_queue.queue)}
+
+
+def test_stuck_page_restarts_only_its_worker(get_pool):
+    pool = get_pool(max_workers=2, extract_timeout=1)
+    pid_set = get_worker_pid_set(pool)
+    stuck_future = pool.submit(b'hang')
+    time.sleep(0.1)  # the other worker is free
+    page_list = [pool.extract(b'sleep:0.6') for _ in range(2)]  # the stuck page times out meanwhile
+    assert [sentences for sentences, _ in page_list] == ['sleep:0.6'] * 2
+    healthy_pid = page_list[0][1]
+    assert page_list[1][1] == healthy_pid  # never interrupted
+    assert stuck_future.result() == []
+    stuck_pid = (pid_set - {healthy_pid}).pop()
+    new_pid_set = get_worker_pid_set(pool)
+    assert healthy_pid in new_pid_set and stuck_pid not in new_pid_set and len(new_pid_set) == 2
+    # the restarted worker extracts the next pages
+    assert {future.result()[1] for future in [pool.submit(b'sleep:0.2') for _ in range(2)]} == new_pid_set
+
+
+def test_crashed_worker_is_restarted(get_pool):
+    pool = get_pool(max_workers=1, extract_timeout=5)
+    assert pool.extract(b'crash') == []
+    assert pool.extract(b'sleep:0')[0] == 'sleep:0'
+
+
+def test_extraction_error_is_raised(get_pool):
+    pool = get_pool(max_workers=1, extract_timeout=5)
+    with pytest.raises(ValueError, match='broken page'):
+        pool.extract(b'error')
+    assert pool.extract(b'sleep:0')[0] == 'sleep:0'
@@ -0,0 +1,53 @@
+import glob
+import os
+
+import pytest
+
+from text_extract.html.lxml_html import LxmlHtmlSvc
+
+FIXTURE_HTML_DIR = os.path.join(os.path.dirname(__file__), '..', 'playground', 'fixture', 'html')
+PARAGRAPH = '<p>A web search engine returns a ranked list of pages that match the query of a user.</p>'
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURE_HTML_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('html_path', sorted(glob.glob(os.path.join(FIXTURE_HTML_DIR, '*.html'))))
+def test_fixture_main_content_is_extracted(html_path):
+    with open(html_path, encoding='utf-8') as f:
+        paragraph_list = LxmlHtmlSvc().extract_from_html(f.read())
+    expected_list = read_fixture(os.path.basename(html_path).replace('.html', '.txt')).splitlines()
+    extracted_text = '\n'.join(paragraph_list)
+    assert [expected for expected in expected_list if expected not in extracted_text] == []
+
+
+@pytest.mark.parametrize('name, boilerplate_list', [
+    ('wordpress_blog_post.html', ['Share this', 'half precision floats', 'Leave a Reply', 'Proudly powered', 'Coalescing identical requests']),
+    ('news_article.html', ['Sign up to our weekly', 'More on this story', 'Comments on this piece', 'All rights reserved']),
+    ('wikipedia_web_search_engine.html', ['redirects here', 'This page was last edited', 'Create account']),
+])
+def test_fixture_boilerplate_is_dropped(name, boilerplate_list):
+    extracted_text = '\n'.join(LxmlHtmlSvc().extract_from_html(read_fixture(name)))
+    assert [boilerplate for boilerplate in boilerplate_list if boilerplate in extracted_text] == []
+
+
+@pytest.mark.parametrize('html', [
+    # body class of a Wikipedia skin, 'menu' and 'header' are parts of feature names
+    '<html><body class="skin-vector vector-feature-language-in-header-enabled vector-feature-main-menu-pinned-disabled">'
+    f'<div>{PARAGRAPH}</div></body></html>',
+    # 'share' inside 'shared' is not a word of the class
+    f'<html><body><div class="shared-content">{PARAGRAPH}</div></body></html>',
+    # wrapper of the main content with a boilerplate word
+    f'<html><body><div id="page" class="site has-sidebar"><main>{PARAGRAPH}</main></div></body></html>',
+    f'<html><body><div class="nav-layout"><div role="main">{PARAGRAPH}</div></div></body></html>',
+])
+def test_content_container_is_kept(html):
+    assert LxmlHtmlSvc().extract_from_html(html) == [' '.join(PARAGRAPH[3:-4].split())]
+
+
+@pytest.mark.parametrize('attribute', ['class="share-buttons"', 'id="site_footer"', 'class="widget sidebar"', 'class="comment-list"'])
+def test_boilerplate_block_is_dropped(attribute):
+    html = f'<html><body><main>{PARAGRAPH}<div {attribute}><p>This block is not part of the article content at all.</p></div></main></body></html>'
+    assert len(LxmlHtmlSvc().extract_from_html(html)) == 1
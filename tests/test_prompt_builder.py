@@ -0,0 +1,75 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from PromptBuilder import PromptBuilder
+
+
+def make_gpt_input_text_df(row_list):
+    """row_list: [(url_id, url, text)] in rank order"""
+    return pd.DataFrame(row_list, columns=['url_id', 'url', 'text'])
+
+
+def count_tokens(fake_encoding, text):
+    return len(fake_encoding.tokenize(text))
+
+
+def test_context_layout(fake_encoding):
+    df = make_gpt_input_text_df([(2, 'https://www.b.com/x', 'b first'), (1, 'https://a.com', 'a first'), (2, 'https://www.b.com/x', 'b second')])
+    prompt_context = PromptBuilder(1000).build(df)
+    # sources in url_id order, rows of a source in rank order, 'www.' stripped from the domain
+    assert prompt_context.context_str == 'Source [1] a.com\na first\n\n\nSource [2] b.com\nb first\nb second\n\n\n'
+    assert prompt_context.is_included.tolist() == [True, True, True]
+    assert prompt_context.used_token == count_tokens(fake_encoding, prompt_context.context_str)
+    assert (prompt_context.dropped_token, prompt_context.number_of_dropped_row) == (0, 0)
+
+
+def test_row_that_does_not_fit_is_skipped_but_a_shorter_lower_ranked_row_is_taken(fake_encoding):
+    df = make_gpt_input_text_df([(1, 'https://a.com', 'one two three'), (1, 'https://a.com', ' '.join(['long'] * 50)), (1, 'https://a.com', 'short')])
+    prompt_context = PromptBuilder(20).build(df)
+    assert prompt_context.is_included.tolist() == [True, False, True]
+    assert prompt_context.number_of_dropped_row == 1
+    assert prompt_context.dropped_token == 50
+
+
+def test_source_header_is_paid_with_the_first_row_of_the_source(fake_encoding):
+    df = make_gpt_input_text_df([(1, 'https://a.com', 'a'), (2, 'https://b.com', 'b')])
+    one_source_token = PromptBuilder(1000).build(df.iloc[:1]).used_token
+    # room for the first source only: the row of the second source would also cost its header
+    prompt_context = PromptBuilder(one_source_token + 2).build(df)
+    assert prompt_context.is_included.tolist() == [True, False]
+
+
+def test_rows_are_dropped_while_the_tokenized_context_is_over_budget(fake_encoding):
+    # the estimate counts 1 token per source separator, FakeEncoding counts '\n\n' as 2: the estimate is too low by 1 per source
+    df = make_gpt_input_text_df([(i, f'https://s{i}.com', f'text of source {i}') for i in range(1, 6)])
+    full_token = PromptBuilder(1000).build(df).used_token
+    prompt_context = PromptBuilder(full_token - 1).build(df)
+    assert prompt_context.used_token <= full_token - 1
+    assert prompt_context.used_token == count_tokens(fake_encoding, prompt_context.context_str)
+    assert prompt_context.is_included.tolist() == [True, True, True, True, False]  # the lowest ranked row goes first
+
+
+def test_used_token_never_exceeds_budget(fake_encoding):
+    rng = random.Random(0)
+    row_list = [(rng.randint(1, 6), None, ' '.join(rng.choice(['alpha', 'beta', 'x.y', '[1]', 'gamma,']) for _ in range(rng.randint(1, 40))))
+                for _ in range(40)]
+    df = make_gpt_input_text_df([(url_id, f'https://www.site{url_id}.com/page', text) for url_id, _, text in row_list])
+    df['len_token'] = [count_tokens(fake_encoding, text) for text in df['text']]
+    for token_budget in [0, 1, 5, 17, 60, 150, 400, 10000]:
+        prompt_context = PromptBuilder(token_budget).build(df)
+        assert prompt_context.used_token <= token_budget
+        assert prompt_context.used_token == (count_tokens(fake_encoding, prompt_context.context_str) if prompt_context.context_str else 0)
+        included_text_list = df['text'][prompt_context.is_included].tolist()
+        assert all(f"\n{text}\n" in prompt_context.context_str for text in included_text_list)
+        assert prompt_context.number_of_dropped_row == int((~prompt_context.is_included).sum())
+
+
+@pytest.mark.parametrize('token_budget', [0, 100])
+def test_empty_input(fake_encoding, token_budget):
+    prompt_context = PromptBuilder(token_budget).build(make_gpt_input_text_df([]))
+    assert prompt_context.context_str == ''
+    assert prompt_context.used_token == 0
+    assert isinstance(prompt_context.is_included, np.ndarray) and len(prompt_context.is_included) == 0
@@ -0,0 +1,167 @@
+import threading
+import time
+
+import openai
+import pytest
+
+from RateLimitScheduler import (PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RateLimitScheduler, TokenBucket, get_current_priority,
+                                parse_duration_second, rate_limit_priority)
+
+
+def get_scheduler(requests_per_minute=600, tokens_per_minute=100000, max_retries=2, backoff_base=0.001, max_backoff=0.2):
+    return RateLimitScheduler('test', requests_per_minute, tokens_per_minute, max_retries, backoff_base, max_backoff)
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+@pytest.mark.parametrize('duration, expected', [('6m0s', 360), ('20ms', 0.02), ('1.5s', 1.5), ('1h2m', 3720), ('7', 7), (' 0.5', 0.5),
+                                                (None, None), ('', None), ('soon', None)])
+def test_parse_duration_second(duration, expected):
+    if expected is None:
+        assert parse_duration_second(duration) is None
+    else:
+        assert parse_duration_second(duration) == pytest.approx(expected)
+
+
+def test_token_bucket():
+    bucket = TokenBucket(60)  # 1 per second
+    now = bucket.updated_at
+    assert bucket.get_wait_second(10, now) == 0.0
+    bucket.consume(55)
+    assert bucket.get_wait_second(10, now) == pytest.approx(5)
+    assert bucket.get_wait_second(10, now + 5) == 0.0
+    # larger than the bucket: waits for a full bucket, not forever
+    assert bucket.get_wait_second(1000, now + 5) == pytest.approx(50)
+    bucket.refill(now + 1000)
+    assert bucket.level == 60
+    bucket.limit_level(12)
+    assert bucket.level == 12
+    bucket.limit_level(30)
+    assert bucket.level == 12
+
+
+def test_acquire_starts_interactive_before_background():
+    scheduler = get_scheduler(requests_per_minute=120)  # 2 per second
+    scheduler.request_bucket.level = 0
+    started_list = []
+
+    def call(name, priority):
+        scheduler.acquire(1, priority)
+        started_list.append(name)
+
+    background_thread = threading.Thread(target=call, args=('bg', PRIORITY_BACKGROUND))
+    background_thread.start()
+    wait_until(lambda: scheduler.get_stats()['queue_depth'] == 1)
+    interactive_thread = threading.Thread(target=call, args=('ui', PRIORITY_INTERACTIVE))
+    interactive_thread.start()
+    wait_until(lambda: scheduler.get_stats()['queue_depth'] == 2)
+    assert scheduler.get_stats()['queue_depth_by_priority'] == {'interactive': 1, 'background': 1}
+
+    background_thread.join(timeout=5)
+    interactive_thread.join(timeout=5)
+    assert started_list == ['ui', 'bg']
+    stats = scheduler.get_stats()
+    assert stats['queue_depth'] == 0
+    assert stats['max_queue_depth'] == 2
+    assert stats['number_of_request'] == 2
+
+
+def test_rate_limited_call_pauses_the_provider_then_succeeds():
+    scheduler = get_scheduler()
+    call_time_list = []
+
+    def func():
+        call_time_list.append(time.monotonic())
+        if len(call_time_list) == 1:
+            raise openai.error.RateLimitError('slow down', headers={'Retry-After': '0.1', 'x-ratelimit-remaining-requests': '3'})
+        return 'ok'
+
+    assert scheduler.run(func, token_count=10) == 'ok'
+    assert call_time_list[1] - call_time_list[0] >= 0.1
+    stats = scheduler.get_stats()
+    assert stats['number_of_retry'] == 1
+    assert stats['number_of_rate_limited'] == 1
+    assert stats['number_of_failure'] == 0
+    assert stats['number_of_request'] == 2
+    assert stats['remaining_requests'] <= 3
+
+
+def test_retry_wait_uses_the_longest_reset_header_capped_at_max_backoff():
+    scheduler = get_scheduler(backoff_base=0.001, max_backoff=10)
+    ex = openai.error.RateLimitError('slow down', headers={'x-ratelimit-reset-requests': '20ms', 'x-ratelimit-reset-tokens': '1.5s'})
+    assert 1.5 <= scheduler.get_retry_wait_second(ex, 0) <= 1.501
+    ex = openai.error.RateLimitError('slow down', headers={'x-ratelimit-reset-tokens': '6m0s'})
+    assert scheduler.get_retry_wait_second(ex, 0) == 10
+    # no header: exponential backoff
+    assert 0.004 <= scheduler.get_retry_wait_second(openai.error.APIError('error'), 2) <= 0.005
+
+
+def test_insufficient_quota_is_not_retried():
+    scheduler = get_scheduler()
+    call_list = []
+
+    def func():
+        call_list.append(1)
+        raise openai.error.RateLimitError('quota', code='insufficient_quota')
+
+    with pytest.raises(openai.error.RateLimitError):
+        scheduler.run(func)
+    assert len(call_list) == 1
+    assert scheduler.get_stats()['number_of_failure'] == 1
+    assert scheduler.get_stats()['number_of_retry'] == 0
+
+
+def test_non_retryable_error_propagates_immediately():
+    scheduler = get_scheduler()
+    call_list = []
+
+    def func():
+        call_list.append(1)
+        raise ValueError('bad request')
+
+    with pytest.raises(ValueError):
+        scheduler.run(func)
+    assert len(call_list) == 1
+    assert scheduler.get_stats()['number_of_retry'] == 0
+
+
+def test_exhausted_retries_raise():
+    scheduler = get_scheduler(max_retries=2)
+    call_list = []
+
+    def func():
+        call_list.append(1)
+        raise openai.error.APIConnectionError('connection reset')
+
+    with pytest.raises(openai.error.APIConnectionError):
+        scheduler.run(func)
+    assert len(call_list) == 3
+    stats = scheduler.get_stats()
+    assert stats['number_of_retry'] == 2
+    assert stats['number_of_failure'] == 1
+    assert stats['number_of_rate_limited'] == 0
+
+
+def test_sync_with_headers_lowers_the_buckets():
+    scheduler = get_scheduler(requests_per_minute=600, tokens_per_minute=100000)
+    scheduler.sync_with_headers(openai.error.RateLimitError('slow down', headers={'X-RateLimit-Remaining-Requests': '5',
+                                                                                'X-RateLimit-Remaining-Tokens': '1000'}))
+    assert scheduler.request_bucket.level <= 5
+    assert scheduler.token_bucket.level <= 1000
+
+
+def test_rate_limit_priority_context():
+    assert get_current_priority() == PRIORITY_INTERACTIVE
+    with rate_limit_priority(PRIORITY_BACKGROUND):
+        assert get_current_priority() == PRIORITY_BACKGROUND
+    assert get_current_priority() == PRIORITY_INTERACTIVE
+
+    priority_list = []
+    with rate_limit_priority(PRIORITY_BACKGROUND):
+        get_scheduler().run(lambda: priority_list.append(get_current_priority()))
+    assert priority_list == [PRIORITY_BACKGROUND]
@@ -0,0 +1,71 @@
+import logging
+
+import pytest
+
+import TokenizerService
+from NLPUtil import num_tokens_from_string, num_tokens_from_strings
+from TokenizerService import TokenizerService as Tokenizer, get_tokenizer_service, preload_tokenizer_services
+
+
+def test_count_tokens_batch_keeps_order_and_duplicates(fake_encoding):
+    tokenizer = Tokenizer('gpt-3.5-turbo')
+    assert tokenizer.count_tokens_batch(['Hello world', 'Hello world', 'ChatGPT is here', '']) == [2, 2, 3, 0]
+    # duplicates of one batch are encoded once
+    assert fake_encoding.encoded_text_list == ['Hello world', 'ChatGPT is here', '']
+
+
+def test_memo_hits_skip_encode_batch(fake_encoding):
+    tokenizer = Tokenizer('gpt-3.5-turbo')
+    tokenizer.count_tokens_batch(['a b', 'c'])
+    number_of_encode_call = fake_encoding.number_of_encode_call
+    assert tokenizer.count_tokens_batch(['c', 'a b']) == [1, 2]
+    assert tokenizer.count_tokens('a b') == 2
+    assert fake_encoding.number_of_encode_call == number_of_encode_call
+
+    # only the misses of a batch are encoded
+    assert tokenizer.count_tokens_batch(['a b', 'd e f', 'c']) == [2, 3, 1]
+    assert fake_encoding.number_of_encode_call == number_of_encode_call + 1
+    assert fake_encoding.encoded_text_list[-1:] == ['d e f']
+
+
+def test_memo_evicts_least_recently_used(fake_encoding):
+    tokenizer = Tokenizer('gpt-3.5-turbo', max_number_of_memo=2)
+    tokenizer.count_tokens_batch(['one', 'two'])
+    tokenizer.count_tokens('one')  # 'two' becomes the least recently used
+    tokenizer.count_tokens('three')
+    assert list(tokenizer.count_memo) == ['one', 'three']
+
+    fake_encoding.encoded_text_list.clear()
+    tokenizer.count_tokens_batch(['one', 'two'])
+    assert fake_encoding.encoded_text_list == ['two']
+    assert len(tokenizer.count_memo) == 2
+
+
+def test_unmemoized_count_does_not_touch_the_memo(fake_encoding):
+    tokenizer = Tokenizer('gpt-3.5-turbo')
+    tokenizer.count_tokens('memoized text')
+    assert tokenizer.count_tokens('a whole prompt\n\n', is_memoized=False) == 5
+    assert list(tokenizer.count_memo) == ['memoized text']
+
+
+def test_one_tokenizer_per_model(fake_encoding):
+    assert get_tokenizer_service('gpt-3.5-turbo') is get_tokenizer_service('gpt-3.5-turbo')
+    assert get_tokenizer_service('gpt-3.5-turbo') is not get_tokenizer_service('text-embedding-ada-002')
+    # NLPUtil helpers share the tokenizer and its memo
+    assert num_tokens_from_strings(['x y', 'z']) == [2, 1]
+    assert num_tokens_from_string('x y') == 2
+    assert list(get_tokenizer_service().count_memo) == ['z', 'x y']
+
+
+def test_preload_logs_failures_instead_of_raising(monkeypatch, caplog):
+    def encoding_for_model(model):
+        raise ConnectionError('no network')
+
+    monkeypatch.setattr(TokenizerService.tiktoken, 'encoding_for_model', encoding_for_model)
+    monkeypatch.setattr(TokenizerService, 'tokenizer_service_dict', {})
+    with caplog.at_level(logging.WARNING, logger='TokenizerService'):
+        preload_tokenizer_services(['gpt-3.5-turbo'])
+    assert 'no network' in caplog.text
+    assert TokenizerService.tokenizer_service_dict == {}
+    with pytest.raises(ConnectionError):  # retried by the first request
+        get_tokenizer_service('gpt-3.5-turbo')